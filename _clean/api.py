@@ -0,0 +1,65 @@
+# Cleans exports from Python, for callers that keep a process around
+# (such as service.py) and want to skip the command line:
+#
+#   import api
+#   api.warm()
+#   outputs = api.clean_source('aea', 'data/aea.csv')
+#   api.run('out', aea='data/aea.csv', cfg=api.options(['--getlinks']))
+
+from pathlib import Path
+import argparse
+
+from dateparser import parse
+
+import pipeline
+from rules import current_people, current_rules
+from stages import no_stage
+from storage import input_cache_from_args
+
+
+def options(args=(), **overrides):
+    # The pipeline's options as the command line would give them for args
+    # (e.g. ['--getlinks', '--tries', '3']), with keyword overrides on top
+    # (e.g. keep_duplicates=True). Errors in args raise SystemExit, as
+    # they do on the command line.
+    cfg = pipeline.parser.parse_args(list(args))
+    for name, value in overrides.items():
+        if not hasattr(cfg, name):
+            raise TypeError(f'unknown option {name!r}')
+        setattr(cfg, name, value)
+    if cfg.chunksize and cfg.parquet:
+        raise ValueError('--chunksize can not write parquet outputs')
+    if cfg.people is not None and not current_people(cfg.people):
+        raise ValueError(f'--people: no <person>.toml in {cfg.people}')
+    return cfg
+
+
+def warm():
+    # Does the one-off work of a first run up front: compiles the rules and
+    # the gazetteer and lets dateparser load its language data.
+    current_rules()
+    parse('1 January 2025')
+
+
+def clean_source(name, csvfile, cfg=None, stage=no_stage):
+    # Cleans one export ('aea' or 'ejm') and returns its outputs (frames
+    # and the code matrix, as the cleaners' clean_* give them) without
+    # writing any file.
+    cfg = cfg or options()
+    source = pipeline.SOURCES[name]
+    raw = source.load(csvfile, cfg.csv_engine, input_cache_from_args(cfg))
+    return source.clean(raw, pipeline.source_cfg(cfg, name), stage)
+
+
+def run(directory, aea=None, ejm=None, cfg=None, stage=no_stage):
+    # Runs the whole pipeline with its outputs under directory: the output
+    # tree in directory/output and directory/to_admin.csv, which is
+    # returned. aea and ejm default to the exports named in cfg.
+    cfg = argparse.Namespace(**vars(cfg or options()))
+    directory = Path(directory)
+    cfg.aea = Path(aea) if aea is not None else cfg.aea
+    cfg.ejm = Path(ejm) if ejm is not None else cfg.ejm
+    cfg.output = directory / 'output'
+    cfg.admin = directory / 'to_admin.csv'
+    pipeline.run(cfg, stage)
+    return cfg.admin
@@ -1,21 +1,80 @@
 from pathlib import Path
 import re
 import argparse
-import requests
 import logging
-import time
-import random
-import tomllib
 from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 import pandas as pd
-from dateparser import parse
-from datefinder import find_dates
+
+from codes import JEL_VOCABULARY, CodeMatrix, code_lists
+from deadlines import (
+    DeadlineExtractor,
+    add_season_arguments,
+    earliest_dates,
+    parse_dates,
+)
+from parallel import add_parallel_arguments, map_chunks
+from stages import (
+    add_profile_arguments,
+    count,
+    no_stage,
+    profiler_from_args,
+    timed,
+)
+from rules import (
+    add_rules_arguments,
+    any_in,
+    current_rules,
+    expand_flags,
+    pack_flags,
+    people_from_args,
+    surviving,
+)
+from state import (
+    add_state_arguments,
+    derive,
+    fingerprints,
+    source_digest,
+    state_from_args,
+)
+from join import EXCEL_SORT_KEYS, excel_outputs
+from linkstore import (
+    ERROR,
+    attach,
+    link_record,
+    link_table,
+    skipped_table,
+    with_skipped,
+)
+from storage import (
+    add_storage_arguments,
+    categorize,
+    input_cache_from_args,
+    iter_source_csv,
+    read_source_csv,
+    write_frame,
+    write_people,
+)
+from extract import PageParser, aea_apply_link
+from gazetteer import load_gazetteer, unique_lists
+from httpcache import (
+    OfflineCacheMiss,
+    add_cache_arguments,
+    cache_from_args,
+    fetch,
+)
+from fetcher import (
+    HostRateLimiter,
+    add_fetch_arguments,
+    fetch_all,
+    make_session,
+    retry_budget_from_args,
+)
+from journal import add_journal_arguments, journal_from_args
+from search import ANY_FIELD, add_search_arguments, search_index_from_args
 
 logger = logging.getLogger(__file__)
-logging.basicConfig(level=logging.WARNING)
 
 parser = argparse.ArgumentParser(description='Clean AEA data')
 parser.add_argument('csvfile', type=lambda s: Path(s))
@@ -25,285 +84,382 @@ parser.add_argument('academic', type=lambda s: Path(s))
 parser.add_argument('verbose', type=lambda s: Path(s))
 parser.add_argument('--getlinks', action='store_true')
 parser.add_argument('--tries', type=int, default=1)
-cfg = parser.parse_args()
-
-aea_csv = Path(cfg.csvfile)
-
-with open(Path(__file__).parent / '..' / 'config' / 'exclude.toml',
-          'rb') as fh:
-    exclude = tomllib.load(fh)
-
-
-def extract_jel_codes(jel_entry):
-    jel_strs = jel_entry.split('\n')
-    result = []
-    for jel_str in jel_strs:
-        prog = re.compile(r'(.*?) - .*')
-        match = prog.match(jel_str)
-        result.append(match.groups()[0])
-    return result
-
-
-def load_aea(aea_csv):
-    return pd.read_csv(aea_csv, encoding_errors='replace')
-
-
-def aea_earliest_date(row, lowerbound, upperbound):
-
-    def find_best(s):
-        if pd.isna(s):
-            return parse('9999-01-01')
-        clean_matches = []
-        clean_sources = []
-        result = list(find_dates(s, source=True))
-        sources = [r[1] for r in result]
-        for source in sources:
-            check = list(find_dates(source, strict=True))
-            if check:
-                for c in check:
-                    clean_matches.append(c)
-                    continue
-            else:
-                check2 = list(
-                    find_dates(source + ' 2024', strict=True, source=True)
-                )
-                for c in check2:
-                    clean_matches.append(c[0])
-                    clean_sources.append(c[1])
-                    continue
-        clean_matches = [c.replace(tzinfo=None) for c in clean_matches]
-        for c in sorted(clean_matches):
-            if c > lowerbound and c < upperbound:
-                return c
-        if clean_matches:
-            return min(clean_matches)
-        return parse('9999-02-02')
-
-    def parse_(s):
-        try:
-            return parse(s)
-        except TypeError:
-            return parse('9999-02-02')
+add_cache_arguments(parser)
+add_fetch_arguments(parser)
+add_journal_arguments(parser)
+add_season_arguments(parser)
+add_rules_arguments(parser)
+add_search_arguments(parser)
+add_state_arguments(parser)
+add_storage_arguments(parser)
+add_parallel_arguments(parser)
+add_profile_arguments(parser)
+
+# Worked out only for surviving postings, and added to discarded.csv
+# with --all-rows.
+DERIVED_COLUMNS = ['EARLIEST DATE', 'APPLICATION LINK']
+
+# The code the deadlines and application links kept in the state store are
+# worked out with: when it changes, they are worked out again.
+DATES_CODE = source_digest(__file__, Path(__file__).parent / 'deadlines.py')
+LINKS_CODE = source_digest(
+    __file__,
+    Path(__file__).parent / 'extract.py',
+    Path(__file__).parent / 'linkstore.py',
+)
+
+# Kept as categoricals from loading on.
+CATEGORICAL_COLUMNS = ['jp_section']
+
+# The FLAGS bits of a cleaned frame, as columns of verbose.csv.
+VERBOSE_FLAGS = [
+    'BAD COUNTRY',
+    'BAD JEL CODES',
+    'POSTDOC',
+    'LECTURER',
+    'ASSISTANT PROF',
+    'ASSOCIATE PROF',
+    'FULL PROF',
+    'VISITING',
+]
+
+ANY_FIELD_TEXT = re.compile(r'any.field')
+POSTDOC = re.compile(r'post(?:doc|-doc| doc)')
+OPEN_RANK = re.compile(r'open.rank')
+FULL_PROF = re.compile(r'full(?!.time)')
+ASSOCIATE_PROF = re.compile(
+    r'(?:(?<!doc )associate|(?<!doctoral )associate)',
+)
+ASSISTANT_PROF = re.compile(r'(?<!teaching )assistant')
+LECTURER = re.compile(r'lecture|teach')
+
+
+def extract_jel_codes(jel_entries):
+    # One code per line ("C1 - Econometric and Statistical Methods..."),
+    # indexed by the position of its row.
+    return (
+        jel_entries.reset_index(drop=True)
+        .str.split('\n')
+        .explode()
+        .str.extract(r'^(.*?) - ', expand=False)
+    )
+
+
+def aea_jel_matrix(aea):
+    return CodeMatrix.from_exploded(
+        aea['JEL_Codes'].reset_index(drop=True).explode(),
+        aea.index,
+        JEL_VOCABULARY,
+    )
 
-    earliest_ad_text_d = find_best(row['jp_full_text'])
-    earliest_official_d = min(
-        [parse_(s) for s in [row['Application_deadline']]]
+
+def load_aea(aea_csv, engine='c', cache_dir=None):
+    aea = read_source_csv(
+        aea_csv,
+        engine=engine,
+        cache_dir=cache_dir,
+        text_columns=['Application_deadline', 'Date_Active'],
+        encoding_errors='replace',
+    )
+    return categorize(aea, CATEGORICAL_COLUMNS)
+
+
+def iter_aea(aea_csv, chunksize):
+    chunks = iter_source_csv(aea_csv, chunksize, encoding_errors='replace')
+    for chunk in chunks:
+        yield categorize(chunk, CATEGORICAL_COLUMNS)
+
+
+@timed
+def aea_earliest_dates(aea, extractor):
+    return earliest_dates(
+        aea['jp_full_text'].map(extractor.earliest),
+        parse_dates(aea['Application_deadline']),
     )
-    d = min([earliest_ad_text_d, earliest_official_d])
-    return f'{d.year}-{d.month:02d}-{d.day:02d}'
 
 
 def filter_aea_default(aea):
-    aea = aea.copy()
+    # The raw columns are shared with the export, not copied: the cleaners
+    # only ever add columns.
+    aea = aea.copy(deep=False)
     aea.drop('joe_issue_ID', inplace=True, axis=1)
     aea.drop('jp_agency_insertion_num', inplace=True, axis=1)
-    aea['ACADEMIC'] = aea.apply(aea_is_academic, axis=1)
-    aea['JEL_Codes'] = aea.apply(
-        lambda row: extract_jel_codes(row['JEL_Classifications']),
-        axis=1,
-    )
-    aea['COUNTRIES'] = aea.apply(
-        lambda row: countries(row),
-        axis=1,
+    aea['ACADEMIC'] = aea_is_academic(aea)
+    aea['JEL_Codes'] = code_lists(
+        extract_jel_codes(aea['JEL_Classifications']),
+        aea.index,
     )
+    aea['COUNTRIES'] = aea_countries(aea)
     aea['DISCARD'] = False
     return aea
 
 
-def aea_applyforthisjoblink(row, bar=None):
-    try:
-        if not cfg.getlinks:
-            return None
-        for i in range(cfg.tries):
-            try:
-                url = row['AD WEBPAGE LINK']
-                response = requests.get(url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                links = soup.find_all(
-                    'a',
-                    class_='button',
-                    string=lambda text: text and 'Apply for This Job' in text,
-                )
-                for link in links:
-                    if link.get_text() == 'Apply for This Job (link)':
-                        typ = 'link'
-                        continue
-                    if link.get_text() == 'Apply for This Job':
-                        typ = 'javascript'
-                        continue
-                    raise ValueError('No application link found.')
-                if typ == 'link':
-                    return link['href']
-                if typ == 'javascript':
-                    return 'JOEWEBAPPLY'
-            except Exception as e:
-                logger.warning(f'Error for\n{url} on try {i+1}:\n{e}')
-            finally:
-                time.sleep(random.randint(2, 4))
-        return None
-    finally:
-        if bar is not None:
-            bar.update()
+def aea_applyforthisjoblink(url, session, cache, limiter, parse, retry):
+    error = None
+    for i in range(retry.tries):
+        if i:
+            if not retry.retry(i):
+                count('retries refused')
+                break
+            count('retries')
+        try:
+            response = fetch(
+                cache,
+                session,
+                url,
+                on_network=lambda: limiter.acquire(url),
+            )
+            return parse(aea_apply_link, response.content)
+        except OfflineCacheMiss as e:
+            # With --offline no retry can bring the page into the cache.
+            error = f'{type(e).__name__}: {e}'
+            count('fetch errors')
+            logger.warning(f'Error for\n{url}:\n{e}')
+            break
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            count('fetch errors')
+            logger.warning(f'Error for\n{url} on try {i+1}:\n{e}')
+    return link_record(ERROR, error=error)
+
+
+def aea_applications(aea, cfg, store):
+    if not cfg.getlinks:
+        return skipped_table(aea['jp_id'])
+    cache = cache_from_args(cfg)
+    limiter = HostRateLimiter(cfg.rate, cfg.burst)
+    retry = retry_budget_from_args(cfg)
+    fps = fingerprints(aea, ['AD WEBPAGE LINK', 'jp_full_text'], LINKS_CODE)
+    with make_session(cfg.concurrency) as s, \
+            PageParser(cfg.parse_workers) as parse, \
+            journal_from_args(cfg, 'aea') as journal:
+
+        def fetch_link(item):
+            id, fingerprint, url = item
+            return journal.run(
+                id,
+                fingerprint,
+                lambda: aea_applyforthisjoblink(
+                    url, s, cache, limiter, parse, retry
+                ),
+            )
 
+        records = derive(
+            store,
+            'aea',
+            'APPLICATION',
+            aea['jp_id'],
+            fps,
+            lambda todo: fetch_all(
+                zip(
+                    aea.loc[todo, 'jp_id'],
+                    fps[todo],
+                    aea.loc[todo, 'AD WEBPAGE LINK'],
+                ),
+                fetch_link,
+                concurrency=cfg.concurrency,
+                bar=tqdm(total=todo.sum()),
+            ),
+            keep=lambda record: record['status'] != ERROR,
+        )
+        journal.clear()
+    if cache is not None:
+        cache.prune()
+    return link_table(aea['jp_id'], records)
 
-def aea_is_academic(row):
-    section = row['jp_section'].lower()
-    return not ('nonacademic' in section or 'non-academic' in section)
 
+@timed
+def aea_is_academic(aea):
+    section = aea['jp_section'].str.lower()
+    return ~section.str.contains('non-?academic', na=False)
 
-def aea_contains_desired_jel_code(row):
-    prog = re.compile('any.field')
-    saysanyfield = prog.search(row['jp_full_text']) is not None
-    result = row['JEL_Codes'] == [] or any(
-        jel_code not in exclude['jel_codes'] for jel_code in row['JEL_Codes']
-    )
-    return result or saysanyfield
 
+@timed
+def aea_says_any_field(aea, index=None):
+    if index is None:
+        return aea['jp_full_text'].str.contains(ANY_FIELD_TEXT, na=False)
+    return aea['jp_id'].astype(str).isin(index.matching('aea', ANY_FIELD))
 
-def aea_is_postdoc(row):
-    title = row['jp_title'].lower()
-    return 'postdoc' in title or 'post-doc' in title or 'post doc' in title
 
+@timed
+def aea_contains_desired_jel_code(jel, saysanyfield, rules):
+    return jel.any_not_in(rules.jel_codes) | saysanyfield
 
-def aea_is_open_rank(row):
-    title = row['jp_title'].lower()
-    prog = re.compile(r'open.rank')
-    return prog.search(title) is not None
 
+@timed
+def aea_is_postdoc(title):
+    return title.str.contains(POSTDOC, na=False)
 
-def aea_is_full_prof(row):
-    title = row['jp_title'].lower()
-    prog = re.compile(r'full(?!.time)')
-    return prog.search(title) is not None or aea_is_open_rank(row)
 
+@timed
+def aea_is_open_rank(title):
+    return title.str.contains(OPEN_RANK, na=False)
 
-def aea_is_associate_prof(row):
-    title = row['jp_title'].lower()
-    prog = re.compile(
-        r'((?<!doc )associate|(?<!doctoral )associate)',
-    )
-    return prog.search(title) is not None or aea_is_open_rank(row)
 
+@timed
+def aea_is_full_prof(title, open_rank):
+    return title.str.contains(FULL_PROF, na=False) | open_rank
 
-def aea_is_assistant_prof(row):
-    title = row['jp_title'].lower()
-    prog = re.compile(r'(?<!teaching )assistant')
-    return prog.search(title) is not None or aea_is_open_rank(row)
 
+@timed
+def aea_is_associate_prof(title, open_rank):
+    return title.str.contains(ASSOCIATE_PROF, na=False) | open_rank
 
-def aea_is_lecturer(row):
-    title = row['jp_title'].lower()
-    prog = re.compile(r'lecture|teach')
-    return prog.search(title) is not None
 
+@timed
+def aea_is_assistant_prof(title, open_rank):
+    return title.str.contains(ASSISTANT_PROF, na=False) | open_rank
 
-def aea_is_visiting(row):
-    title = row['jp_title'].lower()
-    return 'visiting' in title
 
+@timed
+def aea_is_lecturer(title):
+    return title.str.contains(LECTURER, na=False)
 
-def countries(row):
-    prog = re.compile(r'[A-Z\s]*')
-    progend = re.compile(r'[A-Z\s]*$')
-    result = []
-    for location in row['locations'].split('\n'):
-        match = prog.match(location)
-        matchend = progend.match(location)
-        if matchend:
-            result.append(matchend.group().strip())
-        elif match:
-            result.append(match.group()[:-2].strip())
-        else:
-            print(location)
-    return list(set(result))
 
+@timed
+def aea_is_visiting(title):
+    return title.str.contains('visiting', regex=False, na=False)
 
-def aea_webpage_link(row):
-    return (
-        f'https://www.aeaweb.org/joe/listing.php?JOE_ID=2024-02_{row["jp_id"]}'
+
+def aea_countries(aea):
+    locations = (
+        aea['locations'].reset_index(drop=True).str.split('\n').explode()
     )
+    return unique_lists(load_gazetteer().resolve(locations), aea.index)
 
 
-def aea_contains_bad_country(row):
-    for c in row['COUNTRIES']:
-        if c in exclude['countries']:
-            return True
-    return False
+def aea_webpage_link(jp_id):
+    return f'https://www.aeaweb.org/joe/listing.php?JOE_ID=2024-02_{jp_id}'
 
 
-def filter_aea(aea):
-    aea = filter_aea_default(aea).copy()
-    aea['BAD COUNTRY'] = aea.apply(
-        lambda row: (aea_contains_bad_country(row)),
-        axis=1,
-    )
-    aea['BAD JEL CODES'] = aea.apply(
-        lambda row: (not aea_contains_desired_jel_code(row)),
-        axis=1,
-    )
-    aea['POSTDOC'] = aea.apply(
-        lambda row: (aea_is_postdoc(row)),
-        axis=1,
-    )
-    aea['LECTURER'] = aea.apply(
-        lambda row: (aea_is_lecturer(row)),
-        axis=1,
-    )
-    aea['ASSISTANT PROF'] = aea.apply(
-        lambda row: (aea_is_assistant_prof(row)),
-        axis=1,
-    )
-    aea['ASSOCIATE PROF'] = aea.apply(
-        lambda row: (aea_is_associate_prof(row)),
-        axis=1,
-    )
-    aea['FULL PROF'] = aea.apply(
-        lambda row: (aea_is_full_prof(row)),
-        axis=1,
-    )
-    aea['VISITING'] = aea.apply(
-        lambda row: (aea_is_visiting(row)),
-        axis=1,
-    )
-    aea['DISCARD'] = aea.apply(
-        lambda row: (
-            row['BAD COUNTRY'] or (
-                row['ACADEMIC'] and (
-                    row['BAD JEL CODES'] or row['VISITING'] or row['LECTURER']
-                    or (
-                        (row['FULL PROF'] or row['ASSOCIATE PROF']) and
-                        not (row['ASSISTANT PROF'] or row['POSTDOC'])
-                    )
-                )
-            )
+@timed
+def index_aea(aea, index):
+    changed = index.update(
+        'aea',
+        zip(
+            aea['jp_id'],
+            aea['jp_institution'],
+            aea['jp_title'],
+            aea['jp_full_text'],
+            aea['jp_id'].map(aea_webpage_link),
         ),
-        axis=1,
-    )
-    aea['EARLIEST DATE'] = aea.apply(
-        aea_earliest_date,
-        axis=1,
-        lowerbound=parse('10/01/2024'),
-        upperbound=parse('12/01/2024'),
     )
-    aea['AD WEBPAGE LINK'] = aea.apply(
-        aea_webpage_link,
-        axis=1,
-    )
-    bar = tqdm(total=len(aea))
-    aea['APPLICATION LINK'] = aea.apply(
-        aea_applyforthisjoblink,
-        bar=bar,
-        axis=1,
+    count('postings indexed', changed)
+
+
+@timed
+def aea_contains_bad_country(aea, rules):
+    return any_in(aea['COUNTRIES'], rules.countries)
+
+
+def aea_rule_flags(aea, jel, saysanyfield, rules):
+    # The flags that depend on whose exclusion rules are applied.
+    return {
+        'BAD COUNTRY': aea_contains_bad_country(aea, rules),
+        'BAD JEL CODES': ~aea_contains_desired_jel_code(
+            jel,
+            saysanyfield,
+            rules,
+        ),
+    }
+
+
+@timed
+def aea_discards(aea, jel, saysanyfield, people):
+    # The DISCARD column of every person's rules, from the same classified
+    # frame: only their own flags are worked out again.
+    return {
+        person: rules.discard['aea'].with_flags(
+            aea,
+            aea_rule_flags(aea, jel, saysanyfield, rules),
+        )
+        for person, rules in people.items()
+    }
+
+
+def classify_aea(aea, cfg):
+    aea = filter_aea_default(aea)
+    index = search_index_from_args(cfg)
+    if index is not None:
+        index_aea(aea, index)
+    title = aea['jp_title'].str.lower()
+    open_rank = aea_is_open_rank(title)
+    jel = aea_jel_matrix(aea)
+    saysanyfield = aea_says_any_field(aea, index)
+    rules = current_rules()
+    aea['FLAGS'] = pack_flags(
+        {
+            **aea_rule_flags(aea, jel, saysanyfield, rules),
+            'POSTDOC': aea_is_postdoc(title),
+            'LECTURER': aea_is_lecturer(title),
+            'ASSISTANT PROF': aea_is_assistant_prof(title, open_rank),
+            'ASSOCIATE PROF': aea_is_associate_prof(title, open_rank),
+            'FULL PROF': aea_is_full_prof(title, open_rank),
+            'VISITING': aea_is_visiting(title),
+        },
+        aea.index,
     )
-    aea['SUBMISSION TYPE'] = aea.apply(
-        format_application_link,
-        axis=1,
+    if index is not None:
+        index.close()
+    aea['DISCARD'] = rules.discard['aea'](aea)
+    discards = aea_discards(aea, jel, saysanyfield, people_from_args(cfg))
+    return aea, jel, discards
+
+
+def aea_deadlines(aea, cfg, store):
+    extractor = DeadlineExtractor(cfg.season_start, cfg.season_end)
+    return derive(
+        store,
+        'aea',
+        'EARLIEST DATE',
+        aea['jp_id'],
+        fingerprints(
+            aea,
+            ['jp_full_text', 'Application_deadline'],
+            cfg.season_start,
+            cfg.season_end,
+            DATES_CODE,
+        ),
+        lambda todo: map_chunks(
+            aea_earliest_dates,
+            aea[todo],
+            cfg.workers,
+            extractor=extractor,
+        ),
     )
-    return aea
 
 
-def format_application_link(row):
-    link = row['APPLICATION LINK']
+def filter_aea(aea, cfg, stage=no_stage):
+    with stage('classify'):
+        aea, codes, discards = classify_aea(aea, cfg)
+    store = state_from_args(cfg)
+    rows = surviving(aea, cfg, discards.values())
+    count('postings not dated or fetched', int((~rows).sum()))
+    with stage('dates'):
+        aea['EARLIEST DATE'] = aea_deadlines(aea[rows], cfg, store)
+    with stage('links'):
+        aea['AD WEBPAGE LINK'] = aea['jp_id'].map(aea_webpage_link)
+        applications = with_skipped(
+            aea_applications(aea[rows], cfg, store),
+            aea['jp_id'],
+        )
+        if store is not None:
+            store.close()
+        aea = attach(
+            aea,
+            applications,
+            'jp_id',
+            {'link': 'APPLICATION LINK'},
+        )
+        aea['SUBMISSION TYPE'] = (
+            aea['APPLICATION LINK']
+            .map(format_application_link)
+            .astype('category')
+        )
+    return aea, applications, codes, discards
+
+
+def format_application_link(link):
     if pd.isna(link):
         return None
     if 'JOEWEBAPPLY' in link:
@@ -318,10 +474,14 @@ def format_application_link(row):
     return 'Direct email to be sent by Admin'
 
 
-def format_aea(aea):
+def format_aea(aea, discard=None):
+    # Plain text columns, for the joins and sorts that follow. discard
+    # stands in for the DISCARD column, e.g. for one person's rules.
+    if discard is None:
+        discard = aea['DISCARD']
     new_aea = pd.DataFrame(
         {
-            'Submission Type': aea['SUBMISSION TYPE'],
+            'Submission Type': aea['SUBMISSION TYPE'].astype(object),
             'Letter Submission Deadline Date': aea['EARLIEST DATE'],
             'Application Status': pd.NA,
             'Institution or Organization Name': aea['jp_institution'],
@@ -330,48 +490,87 @@ def format_aea(aea):
             'Job Title': aea['jp_title'],
             'Additional Instructions': pd.NA,
             'Ad Webpage Link': aea['AD WEBPAGE LINK'],
-            'DISCARD': aea['DISCARD'],
+            'DISCARD': discard,
             'ACADEMIC': aea['ACADEMIC'],
         },
     )
     return (
         new_aea[new_aea['DISCARD'] == False]  # noqa
         .drop('DISCARD', axis=1).sort_values(
-            by=['Letter Submission Deadline Date', 'Department Name']
+            by=EXCEL_SORT_KEYS
         ).reset_index(drop=True)
     )
 
 
+def clean_aea(raw_aea, cfg, stage=no_stage):
+    aea, applications, codes, discards = filter_aea(raw_aea, cfg, stage)
+    with stage('format'):
+        # Only the rows each output keeps are copied out of aea and the
+        # export.
+        verbose = expand_flags(
+            aea[aea['DISCARD'] == False],  # noqa
+            VERBOSE_FLAGS,
+        )
+        outputs = excel_outputs(format_aea(aea))
+        discarded = raw_aea[aea['DISCARD']].assign(
+            ACADEMIC=aea['ACADEMIC'],
+        )
+        if cfg.all_rows:
+            discarded = discarded.assign(**{
+                column: aea[column] for column in DERIVED_COLUMNS
+            })
+        # Each person's rows, from the same dates and links.
+        people = {
+            person: excel_outputs(format_aea(aea, discard))
+            for person, discard in discards.items()
+        }
+    return {
+        **outputs,
+        'discarded': discarded,
+        'verbose': verbose,
+        'applications': applications.reset_index(),
+        'codes': CodeMatrix(
+            pd.Index(aea['jp_id'], name='ID'),
+            codes.vocabulary,
+            codes.bits,
+        ),
+        'people': people,
+    }
+
+
+def aea_paths(cfg):
+    return {
+        'excel': cfg.output / 'aea.csv',
+        'discarded': cfg.discarded / 'discarded.csv',
+        'academic': cfg.academic / 'aea.csv',
+        'verbose': cfg.verbose / 'verbose.csv',
+        'applications': cfg.verbose / 'applications.csv',
+        'codes': cfg.verbose / 'codes.npz',
+    }
+
+
+def write_aea(outputs, cfg, append=False):
+    paths = aea_paths(cfg)
+    for kind, frame in outputs.items():
+        if kind == 'people':
+            write_people(frame, paths, cfg.parquet, append)
+            continue
+        if kind == 'codes':
+            frame.save(paths[kind])
+            continue
+        write_frame(frame, paths[kind], parquet=cfg.parquet, append=append)
+
+
 if __name__ == '__main__':
-    raw_aea = load_aea(aea_csv)
-    aea = filter_aea(raw_aea)
-    verbose = aea.copy()
-    verbose = verbose[verbose['DISCARD'] == False]  # noqa
-    formatted = format_aea(aea)
-    excel = formatted.drop(
-        'ACADEMIC',
-        axis=1,
-    ).reset_index(drop=True)
-    discarded = raw_aea.copy()
-    discarded['ACADEMIC'] = aea['ACADEMIC']
-    discarded = discarded[aea['DISCARD']]
-    excel_academic = (
-        formatted[formatted['ACADEMIC']].drop('ACADEMIC',
-                                              axis=1).reset_index(drop=True)
-    )
-    excel.to_csv(
-        cfg.output / 'aea.csv',
-        index=False,
-    )
-    discarded.to_csv(
-        cfg.discarded / 'discarded.csv',
-        index=False,
-    )
-    excel_academic.to_csv(
-        cfg.academic / 'aea.csv',
-        index=False,
-    )
-    verbose.to_csv(
-        cfg.verbose / 'verbose.csv',
-        index=False,
-    )
+    logging.basicConfig(level=logging.WARNING)
+    cfg = parser.parse_args()
+    with profiler_from_args(cfg) as stage:
+        with stage('load'):
+            raw_aea = load_aea(
+                cfg.csvfile,
+                cfg.csv_engine,
+                input_cache_from_args(cfg),
+            )
+        outputs = clean_aea(raw_aea, cfg, stage)
+        with stage('write'):
+            write_aea(outputs, cfg)
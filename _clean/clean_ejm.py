@@ -1,22 +1,83 @@
 from pathlib import Path
 import re
 import argparse
-import time
-import random
 import logging
+import threading
 import tomllib
 
 from tqdm import tqdm
-import requests
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
-from dateparser import parse
-import numpy as np
 import pandas as pd
-from datefinder import find_dates
+
+from codes import CodeMatrix, code_lists
+from deadlines import (
+    DeadlineExtractor,
+    add_season_arguments,
+    earliest_dates,
+    parse_dates,
+)
+from parallel import add_parallel_arguments, map_chunks
+from stages import (
+    add_profile_arguments,
+    count,
+    no_stage,
+    profiler_from_args,
+    timed,
+)
+from rules import (
+    add_rules_arguments,
+    any_in,
+    current_rules,
+    expand_flags,
+    pack_flags,
+    people_from_args,
+    surviving,
+)
+from state import (
+    add_state_arguments,
+    derive,
+    fingerprints,
+    source_digest,
+    state_from_args,
+)
+from join import EXCEL_SORT_KEYS, excel_outputs
+from linkstore import (
+    ERROR,
+    attach,
+    link_record,
+    link_table,
+    skipped_table,
+    with_skipped,
+)
+from storage import (
+    add_storage_arguments,
+    categorize,
+    input_cache_from_args,
+    iter_source_csv,
+    read_source_csv,
+    write_frame,
+    write_people,
+)
+from extract import PageParser, ejm_application_procedure
+from gazetteer import load_gazetteer
+from httpcache import (
+    OfflineCacheMiss,
+    add_cache_arguments,
+    cache_from_args,
+    fetch,
+)
+from fetcher import (
+    HostRateLimiter,
+    add_fetch_arguments,
+    fetch_all,
+    make_session,
+    retry_budget_from_args,
+)
+from journal import add_journal_arguments, journal_from_args
+from search import ANY_FIELD, add_search_arguments, search_index_from_args
 
 logger = logging.getLogger(__file__)
-logging.basicConfig(level=logging.WARNING)
 
 parser = argparse.ArgumentParser(description='Clean EJM data')
 parser.add_argument('csvfile', type=lambda s: Path(s))
@@ -26,286 +87,414 @@ parser.add_argument('academic', type=lambda s: Path(s))
 parser.add_argument('verbose', type=lambda s: Path(s))
 parser.add_argument('--getlinks', action='store_true')
 parser.add_argument('--tries', type=int, default=1)
-cfg = parser.parse_args()
-
-ejm_csv = Path(cfg.csvfile)
-
-with open(Path(__file__).parent / '..' / 'config' / 'exclude.toml',
-          'rb') as fh:
-    exclude = tomllib.load(fh)
-
-
-def extract_ejmcat_codes(ejmcat_entry):
-    prog = re.compile(r'(?:,\s*|;\s*)')
-    ejmcat_strs = prog.split(ejmcat_entry)
-    result = []
-    for ejmcat_str in ejmcat_strs:
-        result.append(ejmcat_str.lower())
-    return result
-
-
-def load_ejm(ejm_csv):
-    return pd.read_csv(ejm_csv, skiprows=1)
-
-
-def ejm_earliest_date(row, lowerbound, upperbound):
-
-    def find_best(s):
-        if pd.isna(s):
-            return parse('9999-01-01')
-        clean_matches = []
-        clean_sources = []
-        result = list(find_dates(s, source=True))
-        sources = [r[1] for r in result]
-        for source in sources:
-            check = list(find_dates(source, strict=True))
-            if check:
-                for c in check:
-                    clean_matches.append(c)
-                    continue
-            else:
-                check2 = list(
-                    find_dates(source + ' 2024', strict=True, source=True)
-                )
-                for c in check2:
-                    clean_matches.append(c[0])
-                    clean_sources.append(c[1])
-                    continue
-        clean_matches = [c.replace(tzinfo=None) for c in clean_matches]
-        for c in sorted(clean_matches):
-            if c > lowerbound and c < upperbound:
-                return c
-        if clean_matches:
-            return min(clean_matches)
-        return parse('9999-02-02')
-
-    def parse_(s):
-        try:
-            return parse(s)
-        except TypeError:
-            return parse('9999-02-02')
-
-    earliest_ad_text_d = find_best(row['Ad text (in markdown format)'])
-    earliest_official_d = min(
-        [
-            parse_(s)
-            for s in [row['Date closes'], row['Target date'], row['Deadline']]
-        ]
+add_cache_arguments(parser)
+add_fetch_arguments(parser)
+add_journal_arguments(parser)
+add_season_arguments(parser)
+add_rules_arguments(parser)
+add_search_arguments(parser)
+add_state_arguments(parser)
+add_storage_arguments(parser)
+add_parallel_arguments(parser)
+add_profile_arguments(parser)
+
+# Worked out only for surviving postings, and added to discarded.csv
+# with --all-rows.
+DERIVED_COLUMNS = [
+    'EARLIEST DATE',
+    'APPLICATION INSTRUCTIONS',
+    'APPLICATION LINK',
+]
+
+# The code the deadlines and application links kept in the state store are
+# worked out with: when it changes, they are worked out again.
+DATES_CODE = source_digest(__file__, Path(__file__).parent / 'deadlines.py')
+LINKS_CODE = source_digest(
+    __file__,
+    Path(__file__).parent / 'extract.py',
+    Path(__file__).parent / 'linkstore.py',
+)
+
+# Kept as categoricals from loading on.
+CATEGORICAL_COLUMNS = ['Types', 'Country']
+
+# The FLAGS bits of a cleaned frame (and its ACADEMIC column), as columns
+# of verbose.csv.
+VERBOSE_FLAGS = [
+    'BAD COUNTRY',
+    'BAD EJMCAT CODES',
+    'ACADEMIC',
+    'POSTDOC',
+    'LECTURER',
+    'ASSISTANT PROF',
+    'ASSOCIATE PROF',
+    'FULL PROF',
+    'VISITING',
+]
+
+ANY_FIELD_TEXT = re.compile(r'any.field')
+POSTDOC = re.compile(r'post(?:doc|-doc| doc)')
+
+
+def extract_ejmcat_codes(ejmcat_entries):
+    # One lowercased category per entry, indexed by the position of its row.
+    return (
+        ejmcat_entries.reset_index(drop=True)
+        .str.split(r'(?:,\s*|;\s*)', regex=True)
+        .explode()
+        .str.lower()
     )
-    d = min([earliest_ad_text_d, earliest_official_d])
-    return f'{d.year}-{d.month:02d}-{d.day:02d}'
 
 
-def ejm_is_academic(row):
-    section = row['Types'].lower()
-    return not ('nonacademic' in section or 'non-academic' in section)
+def ejm_category_matrix(ejm):
+    return CodeMatrix.from_exploded(
+        ejm['EJMCAT_Codes'].reset_index(drop=True).explode(),
+        ejm.index,
+    )
 
 
-def ejm_contains_desired_ejmcat_code(row):
-    prog = re.compile('any.field')
-    saysanyfield = prog.search(row['Ad text (in markdown format)'])
-    result = row['EJMCAT_Codes'] == [] or any(
-        ejmcat_code not in exclude['ejmcats']
-        for ejmcat_code in row['EJMCAT_Codes']
-    )
-    return result or saysanyfield
-
-
-def ejm_is_postdoc(row):
-    title = row['Types'].lower()
-    return 'postdoc' in title or 'post-doc' in title or 'post doc' in title
-
-
-def ejm_is_full_prof(row):
-    title = row['Types'].lower()
-    return 'full' in title
-
-
-def ejm_is_associate_prof(row):
-    title = row['Types'].lower()
-    return 'associate' in title
-
-
-def ejm_is_assistant_prof(row):
-    title = row['Types'].lower()
-    return 'assistant' in title
-
-
-def ejm_is_lecturer(row):
-    title = row['Types'].lower()
-    return 'lect' in title
-
-
-def ejm_is_visiting(row):
-    title = row['Types'].lower()
-    return 'visit' in title
-
-
-def countries(row):
-    try:
-        return [row['Country'].upper()]
-    except AttributeError:
-        if np.isnan(row['Country']):
-            return ['NO COUNTRY']
-        else:
-            raise AttributeError
-
-
-def ejm_contains_bad_country(row):
-    for c in row['COUNTRIES']:
-        if c in exclude['countries']:
-            return True
-    return False
-
-
-def ejm_application_instructions(row, session, bar=None):
-    try:
-        if not cfg.getlinks:
-            return 'ERRORNOLINKDIVIDERERRORNOLINK'
-        for i in range(cfg.tries):
-            try:
-                url = row['URL']
-                logging.info(f'Asking for data from\n{url}')
-                response = session.get(url)
-                soup = BeautifulSoup(response.content, 'html.parser')
-                div = soup.find(
-                    'div',
-                    class_='panel-heading',
-                    string='Application procedure',
-                )
-                p = div.parent.find('div', class_='panel-body')
-                text = p.get_text(strip=True)
-                link = p.find('a')
-                if link:
-                    result = 'DIVIDER'.join([text, link['href']])
-                else:
-                    result = 'DIVIDER'.join([text, 'ERRORNOLINK'])
-                return result
-            except Exception as e:
-                logger.warning(f'Error for\n{url} on try {i+1}:\n{e}')
-            finally:
-                time.sleep(random.randint(2, 4))
-        return 'ERRORNOLINKDIVIDERERRORNOLINK'
-    finally:
-        if bar is not None:
-            bar.update()
-
-
-def ejm_parse_instructions(row, instructions, e):
-    id_ = row['Id']
-    text, link = (
-        instructions.loc[instructions['ID'] == id_, :]['result'].item()
-    ).split('DIVIDER')
-    if text == 'ERRORNOLINK':
-        text = None
-    if link == 'ERRORNOLINK':
-        link = None
-    return (text, link)[e]
-
-
-def filter_ejm(ejm):
-    ejm = filter_ejm_default(ejm).copy()
-    ejm['BAD COUNTRY'] = ejm.apply(
-        lambda row: (ejm_contains_bad_country(row)),
-        axis=1,
+def load_ejm(ejm_csv, engine='c', cache_dir=None):
+    ejm = read_source_csv(
+        ejm_csv,
+        engine=engine,
+        cache_dir=cache_dir,
+        skiprows=1,
+        text_columns=['Date posted', 'Target date', 'Deadline', 'Date closes'],
     )
-    ejm['BAD EJMCAT CODES'] = ejm.apply(
-        lambda row: (not ejm_contains_desired_ejmcat_code(row)),
-        axis=1,
-    )
-    ejm['ACADEMIC'] = ejm.apply(
-        lambda row: ejm_is_academic(row),
-        axis=1,
-    )
-    ejm['POSTDOC'] = ejm.apply(
-        lambda row: (ejm_is_postdoc(row)),
-        axis=1,
+    return categorize(ejm, CATEGORICAL_COLUMNS)
+
+
+def iter_ejm(ejm_csv, chunksize):
+    for chunk in iter_source_csv(ejm_csv, chunksize, skiprows=1):
+        yield categorize(chunk, CATEGORICAL_COLUMNS)
+
+
+@timed
+def ejm_earliest_dates(ejm, extractor):
+    return earliest_dates(
+        ejm['Ad text (in markdown format)'].map(extractor.earliest),
+        parse_dates(ejm['Date closes']),
+        parse_dates(ejm['Target date']),
+        parse_dates(ejm['Deadline']),
     )
-    ejm['LECTURER'] = ejm.apply(
-        lambda row: (ejm_is_lecturer(row)),
-        axis=1,
+
+
+@timed
+def index_ejm(ejm, index):
+    changed = index.update(
+        'ejm',
+        zip(
+            ejm['Id'],
+            ejm['Institution'],
+            ejm['Ad title'],
+            ejm['Ad text (in markdown format)'],
+            ejm['URL'],
+        ),
     )
-    ejm['ASSISTANT PROF'] = ejm.apply(
-        lambda row: (ejm_is_assistant_prof(row)),
-        axis=1,
+    count('postings indexed', changed)
+
+
+@timed
+def ejm_is_academic(ejm):
+    section = ejm['Types'].str.lower()
+    return ~section.str.contains('non-?academic', na=False)
+
+
+@timed
+def ejm_says_any_field(ejm, index=None):
+    if index is None:
+        return ejm['Ad text (in markdown format)'].str.contains(
+            ANY_FIELD_TEXT,
+            na=False,
+        )
+    return ejm['Id'].astype(str).isin(index.matching('ejm', ANY_FIELD))
+
+
+@timed
+def ejm_contains_desired_ejmcat_code(categories, saysanyfield, rules):
+    return categories.any_not_in(rules.ejmcats) | saysanyfield
+
+
+@timed
+def ejm_is_postdoc(title):
+    return title.str.contains(POSTDOC, na=False)
+
+
+@timed
+def ejm_is_full_prof(title):
+    return title.str.contains('full', regex=False, na=False)
+
+
+@timed
+def ejm_is_associate_prof(title):
+    return title.str.contains('associate', regex=False, na=False)
+
+
+@timed
+def ejm_is_assistant_prof(title):
+    return title.str.contains('assistant', regex=False, na=False)
+
+
+@timed
+def ejm_is_lecturer(title):
+    return title.str.contains('lect', regex=False, na=False)
+
+
+@timed
+def ejm_is_visiting(title):
+    return title.str.contains('visit', regex=False, na=False)
+
+
+def ejm_countries(ejm):
+    country = load_gazetteer().resolve(ejm['Country'].str.upper())
+    return country.fillna('NO COUNTRY').map(lambda c: [c])
+
+
+@timed
+def ejm_contains_bad_country(ejm, rules):
+    return any_in(ejm['COUNTRIES'], rules.countries)
+
+
+def ejm_rule_flags(ejm, categories, saysanyfield, rules):
+    # The flags that depend on whose exclusion rules are applied.
+    return {
+        'BAD COUNTRY': ejm_contains_bad_country(ejm, rules),
+        'BAD EJMCAT CODES': ~ejm_contains_desired_ejmcat_code(
+            categories,
+            saysanyfield,
+            rules,
+        ),
+    }
+
+
+@timed
+def ejm_discards(ejm, categories, saysanyfield, people):
+    # The DISCARD column of every person's rules, from the same classified
+    # frame: only their own flags are worked out again.
+    return {
+        person: rules.discard['ejm'].with_flags(
+            ejm,
+            ejm_rule_flags(ejm, categories, saysanyfield, rules),
+        )
+        for person, rules in people.items()
+    }
+
+
+@timed
+def ejm_login(session):
+    loginurl = 'https://econjobmarket.org/login'
+    loginform = BeautifulSoup(
+        session.get(loginurl).content,
+        'html.parser',
     )
-    ejm['ASSOCIATE PROF'] = ejm.apply(
-        lambda row: (ejm_is_associate_prof(row)),
-        axis=1,
+    token = loginform.find(
+        'meta',
+        attrs={'name': 'csrf-token'},
+    )['content']
+    with open(Path(__file__).parent / '../config/ejm_login.toml', 'rb') as fh:
+        credentials = tomllib.load(fh)
+        payload = {
+            '_token': token,
+            'email': credentials['email'],
+            'password': credentials['password'],
+        }
+    session.post(loginurl, data=payload)
+
+
+def ejm_lazy_login(session):
+    # Only log in once a page actually has to come from the network, so a
+    # rerun served from the response cache does no network I/O at all.
+    done = []
+    lock = threading.Lock()
+
+    def login():
+        with lock:
+            if not done:
+                ejm_login(session)
+                done.append(True)
+
+    return login
+
+
+def ejm_application_instructions(
+    url,
+    session,
+    cache,
+    login,
+    limiter,
+    parse,
+    retry,
+):
+
+    def on_network():
+        login()
+        limiter.acquire(url)
+
+    error = None
+    for i in range(retry.tries):
+        if i:
+            if not retry.retry(i):
+                count('retries refused')
+                break
+            count('retries')
+        try:
+            logging.info(f'Asking for data from\n{url}')
+            response = fetch(cache, session, url, on_network=on_network)
+            return parse(ejm_application_procedure, response.content)
+        except OfflineCacheMiss as e:
+            # With --offline no retry can bring the page into the cache.
+            error = f'{type(e).__name__}: {e}'
+            count('fetch errors')
+            logger.warning(f'Error for\n{url}:\n{e}')
+            break
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            count('fetch errors')
+            logger.warning(f'Error for\n{url} on try {i+1}:\n{e}')
+    return link_record(ERROR, error=error)
+
+
+def ejm_applications(ejm, cfg, store):
+    if not cfg.getlinks:
+        return skipped_table(ejm['Id'])
+    cache = cache_from_args(cfg)
+    limiter = HostRateLimiter(cfg.rate, cfg.burst)
+    retry = retry_budget_from_args(cfg)
+    fps = fingerprints(
+        ejm,
+        ['URL', 'Ad text (in markdown format)'],
+        LINKS_CODE,
     )
-    ejm['FULL PROF'] = ejm.apply(
-        lambda row: (ejm_is_full_prof(row)),
-        axis=1,
+    with make_session(cfg.concurrency) as s, \
+            PageParser(cfg.parse_workers) as parse, \
+            journal_from_args(cfg, 'ejm') as journal:
+        login = ejm_lazy_login(s)
+
+        def fetch_instructions(item):
+            id, fingerprint, url = item
+            return journal.run(
+                id,
+                fingerprint,
+                lambda: ejm_application_instructions(
+                    url, s, cache, login, limiter, parse, retry
+                ),
+            )
+
+        records = derive(
+            store,
+            'ejm',
+            'APPLICATION',
+            ejm['Id'],
+            fps,
+            lambda todo: fetch_all(
+                zip(ejm.loc[todo, 'Id'], fps[todo], ejm.loc[todo, 'URL']),
+                fetch_instructions,
+                concurrency=cfg.concurrency,
+                bar=tqdm(total=todo.sum()),
+            ),
+            keep=lambda record: record['status'] != ERROR,
+        )
+        journal.clear()
+    if cache is not None:
+        cache.prune()
+    return link_table(ejm['Id'], records)
+
+
+def classify_ejm(ejm, cfg):
+    ejm = filter_ejm_default(ejm)
+    index = search_index_from_args(cfg)
+    if index is not None:
+        index_ejm(ejm, index)
+    title = ejm['Types'].str.lower()
+    categories = ejm_category_matrix(ejm)
+    saysanyfield = ejm_says_any_field(ejm, index)
+    rules = current_rules()
+    ejm['FLAGS'] = pack_flags(
+        {
+            **ejm_rule_flags(ejm, categories, saysanyfield, rules),
+            'POSTDOC': ejm_is_postdoc(title),
+            'LECTURER': ejm_is_lecturer(title),
+            'ASSISTANT PROF': ejm_is_assistant_prof(title),
+            'ASSOCIATE PROF': ejm_is_associate_prof(title),
+            'FULL PROF': ejm_is_full_prof(title),
+            'VISITING': ejm_is_visiting(title),
+        },
+        ejm.index,
     )
-    ejm['VISITING'] = ejm.apply(
-        lambda row: ejm_is_visiting(row),
-        axis=1,
+    if index is not None:
+        index.close()
+    ejm['ACADEMIC'] = ejm_is_academic(ejm)
+    ejm['DISCARD'] = rules.discard['ejm'](ejm)
+    discards = ejm_discards(
+        ejm,
+        categories,
+        saysanyfield,
+        people_from_args(cfg),
     )
-    ejm['DISCARD'] = ejm.apply(
-        lambda row: (
-            row['BAD COUNTRY'] or (
-                row['ACADEMIC'] and (
-                    row['BAD EJMCAT CODES'] or row['BAD COUNTRY'] or
-                    row['VISITING'] or (
-                        (
-                            row['FULL PROF'] or row['ASSOCIATE PROF'] or row[
-                                'LECTURER']
-                        ) and not (row['ASSISTANT PROF'] or row['POSTDOC'])
-                    )
-                )
-            )
+    return ejm, categories, discards
+
+
+def ejm_deadlines(ejm, cfg, store):
+    extractor = DeadlineExtractor(cfg.season_start, cfg.season_end)
+    return derive(
+        store,
+        'ejm',
+        'EARLIEST DATE',
+        ejm['Id'],
+        fingerprints(
+            ejm,
+            [
+                'Ad text (in markdown format)',
+                'Date closes',
+                'Target date',
+                'Deadline',
+            ],
+            cfg.season_start,
+            cfg.season_end,
+            DATES_CODE,
+        ),
+        lambda todo: map_chunks(
+            ejm_earliest_dates,
+            ejm[todo],
+            cfg.workers,
+            extractor=extractor,
         ),
-        axis=1,
-    )
-    ejm['EARLIEST DATE'] = ejm.apply(
-        ejm_earliest_date,
-        axis=1,
-        lowerbound=parse('10/01/2024'),
-        upperbound=parse('12/01/2024'),
     )
-    with requests.Session() as s:
-        instructions = pd.DataFrame()
-        loginurl = 'https://econjobmarket.org/login'
-        loginform = BeautifulSoup(
-            s.get(loginurl).content,
-            'html.parser',
+
+
+def filter_ejm(ejm, cfg, stage=no_stage):
+    with stage('classify'):
+        ejm, codes, discards = classify_ejm(ejm, cfg)
+    store = state_from_args(cfg)
+    rows = surviving(ejm, cfg, discards.values())
+    count('postings not dated or fetched', int((~rows).sum()))
+    with stage('dates'):
+        ejm['EARLIEST DATE'] = ejm_deadlines(ejm[rows], cfg, store)
+    with stage('links'):
+        applications = with_skipped(
+            ejm_applications(ejm[rows], cfg, store),
+            ejm['Id'],
         )
-        token = loginform.find(
-            'meta',
-            attrs={'name': 'csrf-token'},
-        )['content']
-        with open(Path(__file__).parent / '../config/ejm_login.toml',
-                  'rb') as fh:
-            ejm_login = tomllib.load(fh)
-            payload = {
-                '_token': token,
-                'email': ejm_login['email'],
-                'password': ejm_login['password'],
-            }
-        s.post(loginurl, data=payload)
-        bar = tqdm(total=len(ejm))
-        instructions['result'] = ejm.apply(
-            lambda row: ejm_application_instructions(row, s, bar=bar),
-            axis=1,
+        if store is not None:
+            store.close()
+        ejm = attach(
+            ejm,
+            applications,
+            'Id',
+            {
+                'text': 'APPLICATION INSTRUCTIONS',
+                'link': 'APPLICATION LINK',
+            },
         )
-    instructions['ID'] = ejm['Id']
-    ejm['APPLICATION INSTRUCTIONS'] = ejm.apply(
-        lambda row: ejm_parse_instructions(row, instructions, 0),
-        axis=1,
-    )
-    ejm['APPLICATION LINK'] = ejm.apply(
-        lambda row: ejm_parse_instructions(row, instructions, 1),
-        axis=1,
-    )
-    ejm['SUBMISSION TYPE'] = ejm.apply(
-        format_application_link,
-        axis=1,
-    )
-    return ejm
+        ejm['SUBMISSION TYPE'] = (
+            ejm['APPLICATION LINK']
+            .map(format_application_link)
+            .astype('category')
+        )
+    return ejm, applications, codes, discards
 
 
-def format_application_link(row):
-    link = row['APPLICATION LINK']
+def format_application_link(link):
     if pd.isna(link):
         return None
     netloc = urlparse(link).netloc
@@ -319,73 +508,111 @@ def format_application_link(row):
 
 
 def filter_ejm_default(ejm):
-    ejm = ejm.copy()
-    ejm['COUNTRIES'] = ejm.apply(
-        lambda row: countries(row),
-        axis=1,
-    )
-    ejm['EJMCAT_Codes'] = ejm.apply(
-        lambda row: extract_ejmcat_codes(row['Categories']),
-        axis=1,
+    # The raw columns are shared with the export, not copied: the cleaners
+    # only ever add columns.
+    ejm = ejm.copy(deep=False)
+    ejm['COUNTRIES'] = ejm_countries(ejm)
+    ejm['EJMCAT_Codes'] = code_lists(
+        extract_ejmcat_codes(ejm['Categories']),
+        ejm.index,
     )
     ejm['DISCARD'] = False
     return ejm
 
 
-def format_ejm(ejm):
+def format_ejm(ejm, discard=None):
+    # Plain text columns, for the joins and sorts that follow. discard
+    # stands in for the DISCARD column, e.g. for one person's rules.
+    if discard is None:
+        discard = ejm['DISCARD']
     new_ejm = pd.DataFrame(
         {
-            'Submission Type': ejm['SUBMISSION TYPE'],
+            'Submission Type': ejm['SUBMISSION TYPE'].astype(object),
             'Letter Submission Deadline Date': ejm['EARLIEST DATE'],
             'Application Status': pd.NA,
             'Institution or Organization Name': ejm['Institution'],
             'Department Name': ejm['Department'],
             'Job ID #': ejm['Id'],
-            'Job Title': ejm['Types'],
+            'Job Title': ejm['Types'].astype(object),
             'Additional Instructions': pd.NA,
             'Ad Webpage Link': ejm['URL'],
-            'DISCARD': ejm['DISCARD'],
+            'DISCARD': discard,
             'ACADEMIC': ejm['ACADEMIC'],
         },
     )
     return (
         new_ejm[new_ejm['DISCARD'] == False]  # noqa
         .drop('DISCARD', axis=1).sort_values(
-            by=['Letter Submission Deadline Date', 'Department Name']
+            by=EXCEL_SORT_KEYS
         ).reset_index(drop=True)
     )
 
 
+def clean_ejm(raw_ejm, cfg, stage=no_stage):
+    ejm, applications, codes, discards = filter_ejm(raw_ejm, cfg, stage)
+    with stage('format'):
+        verbose = expand_flags(ejm, VERBOSE_FLAGS)
+        outputs = excel_outputs(format_ejm(ejm))
+        # Only the rows discarded.csv keeps are copied out of the export.
+        discarded = raw_ejm[ejm['DISCARD']].assign(
+            ACADEMIC=ejm['ACADEMIC'],
+        )
+        if cfg.all_rows:
+            discarded = discarded.assign(**{
+                column: ejm[column] for column in DERIVED_COLUMNS
+            })
+        # Each person's rows, from the same dates and links.
+        people = {
+            person: excel_outputs(format_ejm(ejm, discard))
+            for person, discard in discards.items()
+        }
+    return {
+        **outputs,
+        'discarded': discarded,
+        'verbose': verbose,
+        'applications': applications.reset_index(),
+        'codes': CodeMatrix(
+            pd.Index(ejm['Id'], name='ID'),
+            codes.vocabulary,
+            codes.bits,
+        ),
+        'people': people,
+    }
+
+
+def ejm_paths(cfg):
+    return {
+        'excel': cfg.output / 'ejm.csv',
+        'discarded': cfg.discarded / 'discarded.csv',
+        'academic': cfg.academic / 'ejm.csv',
+        'verbose': cfg.verbose / 'verbose.csv',
+        'applications': cfg.verbose / 'applications.csv',
+        'codes': cfg.verbose / 'codes.npz',
+    }
+
+
+def write_ejm(outputs, cfg, append=False):
+    paths = ejm_paths(cfg)
+    for kind, frame in outputs.items():
+        if kind == 'people':
+            write_people(frame, paths, cfg.parquet, append)
+            continue
+        if kind == 'codes':
+            frame.save(paths[kind])
+            continue
+        write_frame(frame, paths[kind], parquet=cfg.parquet, append=append)
+
+
 if __name__ == '__main__':
-    raw_ejm = load_ejm(ejm_csv)
-    ejm = filter_ejm(raw_ejm)
-    verbose = ejm.copy()
-    verbosn = verbose[verbose['DISCARD'] == False]  # noqa
-    formatted = format_ejm(ejm)
-    excel = formatted.drop(
-        'ACADEMIC',
-        axis=1,
-    ).reset_index(drop=True)
-    discarded = raw_ejm.copy()
-    discarded['ACADEMIC'] = ejm['ACADEMIC']
-    discarded = discarded[ejm['DISCARD']]
-    excel_academic = (
-        formatted[formatted['ACADEMIC']].drop('ACADEMIC',
-                                              axis=1).reset_index(drop=True)
-    )
-    excel.to_csv(
-        cfg.output / 'ejm.csv',
-        index=False,
-    )
-    discarded.to_csv(
-        cfg.discarded / 'discarded.csv',
-        index=False,
-    )
-    excel_academic.to_csv(
-        cfg.academic / 'ejm.csv',
-        index=False,
-    )
-    verbose.to_csv(
-        cfg.verbose / 'verbose.csv',
-        index=False,
-    )
+    logging.basicConfig(level=logging.WARNING)
+    cfg = parser.parse_args()
+    with profiler_from_args(cfg) as stage:
+        with stage('load'):
+            raw_ejm = load_ejm(
+                cfg.csvfile,
+                cfg.csv_engine,
+                input_cache_from_args(cfg),
+            )
+        outputs = clean_ejm(raw_ejm, cfg, stage)
+        with stage('write'):
+            write_ejm(outputs, cfg)
@@ -13,9 +13,6 @@ parser.add_argument('output', type=lambda s: Path(s))
 parser.add_argument('discarded', type=lambda s: Path(s))
 parser.add_argument('academic', type=lambda s: Path(s))
 parser.add_argument('verbose', type=lambda s: Path(s))
-cfg = parser.parse_args()
-
-manual_csv = Path(cfg.csvfile)
 
 
 def load_manual(manual_csv):
@@ -44,7 +41,8 @@ def format_manual(manual):
 
 
 if __name__ == '__main__':
-    raw_manual = load_manual(manual_csv)
+    cfg = parser.parse_args()
+    raw_manual = load_manual(cfg.csvfile)
     person = cfg.person
     manual_person = filter_manual(raw_manual, person)
     verbose_person = manual_person.copy()
@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Every JEL code a listing can carry: the top-level letters alone and with
+# their first digit. Codes outside it (e.g. "00") get columns after these.
+JEL_VOCABULARY = [
+    letter + digit
+    for letter in 'ABCDEFGHIJKLMNOPQRYZ'
+    for digit in ['', *'0123456789']
+]
+
+
+class CodeMatrix:
+    # Multi-hot matrix of the codes (JEL codes, EJM categories) of each
+    # posting: row i, column j is set when the posting at index[i] has
+    # vocabulary[j]. Rows are stored bit-packed, eight codes to a byte, so
+    # membership tests are a bitwise and over whole rows.
+
+    def __init__(self, index, vocabulary, bits):
+        self.index = index
+        self.vocabulary = list(vocabulary)
+        self.bits = bits
+
+    @classmethod
+    def from_exploded(cls, exploded, index, vocabulary=()):
+        # exploded holds one code per entry, indexed by row position in
+        # index (so repeated labels in index are fine); missing codes are
+        # left out of the matrix.
+        codes = exploded.dropna()
+        vocabulary = list(vocabulary)
+        vocabulary += sorted(set(codes) - set(vocabulary))
+        dense = np.zeros((len(index), len(vocabulary)), dtype=bool)
+        dense[
+            codes.index.to_numpy(),
+            pd.Index(vocabulary).get_indexer(codes.to_numpy()),
+        ] = True
+        return cls(index, vocabulary, np.packbits(dense, axis=1))
+
+    @classmethod
+    def concat(cls, matrices):
+        vocabulary = []
+        for matrix in matrices:
+            vocabulary += [
+                c for c in matrix.vocabulary if c not in vocabulary
+            ]
+        columns = pd.Index(vocabulary)
+        dense = np.zeros(
+            (sum(len(m.index) for m in matrices), len(vocabulary)),
+            dtype=bool,
+        )
+        start = 0
+        for matrix in matrices:
+            stop = start + len(matrix.index)
+            dense[start:stop, columns.get_indexer(matrix.vocabulary)] = (
+                matrix.dense()
+            )
+            start = stop
+        index = (
+            matrices[0].index.append([m.index for m in matrices[1:]])
+            if matrices else pd.RangeIndex(0)
+        )
+        return cls(index, vocabulary, np.packbits(dense, axis=1))
+
+    def dense(self):
+        return np.unpackbits(
+            self.bits,
+            axis=1,
+            count=len(self.vocabulary),
+        ).astype(bool)
+
+    def mask(self, codes):
+        # Packed row with the columns of the vocabulary that are in codes
+        # (anything supporting `in`, such as a rules.CodeSet).
+        return np.packbits([c in codes for c in self.vocabulary])
+
+    def any_in(self, codes):
+        hit = (self.bits & self.mask(codes)).any(axis=1)
+        return pd.Series(hit, index=self.index)
+
+    def any_not_in(self, codes):
+        # A posting without any code counts as having one outside codes.
+        outside = (self.bits & ~self.mask(codes)).any(axis=1)
+        empty = ~self.bits.any(axis=1)
+        return pd.Series(outside | empty, index=self.index)
+
+    def has(self, code):
+        return pd.Series(
+            self.dense()[:, self.vocabulary.index(code)],
+            index=self.index,
+        )
+
+    def counts(self):
+        return pd.Series(
+            self.dense().sum(axis=0),
+            index=self.vocabulary,
+        ).sort_values(ascending=False, kind='stable')
+
+    def to_frame(self):
+        return pd.DataFrame(
+            self.dense(),
+            index=self.index,
+            columns=self.vocabulary,
+        )
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as fh:
+            np.savez_compressed(
+                fh,
+                index=self.index.to_numpy(),
+                vocabulary=np.array(self.vocabulary, dtype=str),
+                bits=self.bits,
+            )
+
+
+def load_code_matrix(path):
+    with np.load(path) as data:
+        return CodeMatrix(
+            pd.Index(data['index'], name='ID'),
+            data['vocabulary'].tolist(),
+            data['bits'],
+        )
+
+
+def code_lists(exploded, index):
+    # The codes of each row as a list, in the order they were written.
+    lists = exploded.groupby(level=0, sort=True).agg(list)
+    return pd.Series(lists.to_numpy(), index=index, dtype=object)
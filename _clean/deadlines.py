@@ -0,0 +1,191 @@
+from datetime import datetime
+from functools import lru_cache
+import re
+
+import dateparser
+import pandas as pd
+
+NO_TEXT = datetime(9999, 1, 1)
+NO_DATE = datetime(9999, 2, 2)
+
+# Deadline column values read without dateparser: a date, with or without
+# a time of day.
+ISO_DATE = r'[0-9]{4}-[0-9]{2}-[0-9]{2}(?:[ T][0-9]{2}:[0-9]{2}:[0-9]{2})?'
+
+# Distinct strings whose dateparser reading is kept, per process.
+PARSE_CACHE_SIZE = 4096
+
+MONTHS = {
+    'jan': 1,
+    'feb': 2,
+    'mar': 3,
+    'apr': 4,
+    'may': 5,
+    'jun': 6,
+    'jul': 7,
+    'aug': 8,
+    'sep': 9,
+    'oct': 10,
+    'nov': 11,
+    'dec': 12,
+}
+
+_MONTH = (
+    r'(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?'
+    r'|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?'
+    r'|dec(?:ember)?)'
+)
+_DAY = r'(?:[12][0-9]|3[01]|0?[1-9])(?:st|nd|rd|th)?'
+_YEAR = r'(?:19|20)[0-9]{2}'
+
+# One alternation for every date shape the ads use, so each text is scanned
+# exactly once. Named groups tell the shapes apart. A leading weekday needs
+# no pattern of its own, the date that follows it is matched on its own.
+DATE_PATTERN = re.compile(
+    r'\b(?<![\w/.-])(?:'
+    rf'(?P<md_month>{_MONTH})\.?[\s-]+(?P<md_day>{_DAY})\b'
+    rf'(?:\s*,?[\s-]+(?P<md_year>{_YEAR})\b)?'
+    r'|'
+    rf'(?P<dm_day>{_DAY})\s+(?:of\s+)?(?P<dm_month>{_MONTH})\b\.?'
+    rf',?\s+(?P<dm_year>{_YEAR})\b'
+    r'|'
+    r'(?P<ymd_year>(?:19|20)[0-9]{2})(?P<ymd_sep>[-./])'
+    r'(?P<ymd_month>[0-9]{1,2})(?P=ymd_sep)(?P<ymd_day>[0-9]{1,2})\b'
+    r'|'
+    r'(?P<num_a>[0-9]{1,2})(?P<num_sep>[/.])(?P<num_b>[0-9]{1,2})'
+    r'(?P=num_sep)(?P<num_year>[0-9]{4}|[0-9]{2})\b'
+    r')(?![\w/])',
+    re.IGNORECASE,
+)
+
+
+def _date(year, month, day):
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_date(text):
+    # dateparser's reading of a date string (None if it finds no date).
+    # The same few deadlines recur over many postings and runs.
+    return dateparser.parse(text)
+
+
+def parse_dates(values):
+    # The dates of a column of the exports (deadline, closing date, ...).
+    # Each distinct string is read once: ISO dates all at once by pandas,
+    # the others by parse_date. A missing value, or one without a date in
+    # it ("Open until filled"), is NO_DATE.
+    uniques = pd.Series(
+        [v for v in pd.unique(values) if isinstance(v, str)],
+        dtype=object,
+    )
+    iso = uniques[uniques.str.fullmatch(ISO_DATE)]
+    fast = pd.to_datetime(iso, format='ISO8601', errors='coerce')
+    dates = {
+        text: d.to_pydatetime()
+        for text, d in zip(iso, fast)
+        if not pd.isna(d)
+    }
+    for text in uniques:
+        if text not in dates:
+            dates[text] = parse_date(text) or NO_DATE
+    return pd.Series(
+        [dates[v] if isinstance(v, str) else NO_DATE for v in values],
+        index=values.index,
+        dtype=object,
+    )
+
+
+def earliest_dates(*columns):
+    # The earliest date in each row of the columns, as 'YYYY-MM-DD'.
+    return pd.Series(
+        [
+            f'{d.year}-{d.month:02d}-{d.day:02d}'
+            for d in map(min, *columns)
+        ],
+        index=columns[0].index,
+        dtype=object,
+    )
+
+
+class DeadlineExtractor:
+
+    def __init__(self, lowerbound, upperbound):
+        self.lowerbound = lowerbound
+        self.upperbound = upperbound
+
+    def infer_year(self, month, day):
+        # A date without a year belongs to whichever year puts it inside the
+        # season window; otherwise it is taken to be in the window's year.
+        for year in range(self.lowerbound.year, self.upperbound.year + 1):
+            d = _date(year, month, day)
+            if d is not None and self.lowerbound < d < self.upperbound:
+                return year
+        return self.lowerbound.year
+
+    def _from_match(self, m):
+        if m['md_month']:
+            month = MONTHS[m['md_month'][:3].lower()]
+            day = int(m['md_day'].rstrip('stndrh'))
+            year = m['md_year']
+        elif m['dm_month']:
+            return _date(
+                int(m['dm_year']),
+                MONTHS[m['dm_month'][:3].lower()],
+                int(m['dm_day'].rstrip('stndrh')),
+            )
+        elif m['ymd_year']:
+            return _date(
+                int(m['ymd_year']),
+                int(m['ymd_month']),
+                int(m['ymd_day']),
+            )
+        else:
+            a, b = int(m['num_a']), int(m['num_b'])
+            year = int(m['num_year'])
+            if year < 100:
+                year += 2000
+            # Month first, unless the first number cannot be a month.
+            if a > 12:
+                return _date(year, b, a)
+            return _date(year, a, b)
+        if year is None:
+            return _date(self.infer_year(month, day), month, day)
+        return _date(int(year), month, day)
+
+    def dates(self, text):
+        result = []
+        for m in DATE_PATTERN.finditer(text):
+            d = self._from_match(m)
+            if d is not None:
+                result.append(d)
+        return result
+
+    def earliest(self, text):
+        if pd.isna(text):
+            return NO_TEXT
+        matches = sorted(self.dates(text))
+        for d in matches:
+            if self.lowerbound < d < self.upperbound:
+                return d
+        if matches:
+            return matches[0]
+        return NO_DATE
+
+
+def add_season_arguments(parser):
+    parser.add_argument(
+        '--season-start',
+        type=lambda s: datetime.fromisoformat(s),
+        default=datetime(2024, 10, 1),
+        help='deadlines after this date are preferred (YYYY-MM-DD)',
+    )
+    parser.add_argument(
+        '--season-end',
+        type=lambda s: datetime.fromisoformat(s),
+        default=datetime(2024, 12, 1),
+        help='deadlines before this date are preferred (YYYY-MM-DD)',
+    )
@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from linkstore import NO_LINK, OK, link_record
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# The only part of a JOE listing the AEA extractor looks at, the "Apply for
+# This Job" buttons. Everything else is skipped while parsing instead of
+# being built into the tree. EJM pages are parsed whole: their panels are
+# most of the page, and straining to them was slower than the full tree.
+AEA_BUTTONS = SoupStrainer('a', class_='button')
+EJM_HEADING = b'Application procedure'
+
+
+def _soup(content, strainer, parser):
+    return BeautifulSoup(content, parser, parse_only=strainer)
+
+
+def aea_apply_link(content, parser=PARSER, strainer=AEA_BUTTONS):
+    # The application link of a JOE listing page. Raises ValueError on a
+    # button the page should not have.
+    soup = _soup(content, strainer, parser)
+    links = soup.find_all(
+        'a',
+        class_='button',
+        string=lambda text: text and 'Apply for This Job' in text,
+    )
+    typ = None
+    for link in links:
+        if link.get_text() == 'Apply for This Job (link)':
+            typ = 'link'
+            continue
+        if link.get_text() == 'Apply for This Job':
+            typ = 'javascript'
+            continue
+        raise ValueError('No application link found.')
+    if typ == 'link':
+        return link_record(OK, link=link['href'])
+    if typ == 'javascript':
+        return link_record(OK, link='JOEWEBAPPLY')
+    return link_record(NO_LINK)
+
+
+def ejm_application_procedure(content, parser=PARSER):
+    # The text and first link of the "Application procedure" panel of an
+    # EJM position page. A page without the heading is not parsed at all.
+    # Raises AttributeError when there is no panel.
+    body = None
+    if not isinstance(content, bytes) or EJM_HEADING in content:
+        div = BeautifulSoup(content, parser).find(
+            'div',
+            class_='panel-heading',
+            string='Application procedure',
+        )
+        if div is not None:
+            body = div.parent.find('div', class_='panel-body')
+    text = body.get_text(strip=True)
+    link = body.find('a')
+    return link_record(
+        OK,
+        text=text,
+        link=link['href'] if link else None,
+    )
+
+
+class PageParser:
+    # Runs the extractors in worker processes so that parsing does not hold
+    # the GIL on the threads fetching pages: a fetching thread hands over
+    # the page and waits for the record. With one worker or one CPU, where
+    # handing pages over costs more than it saves, pages are parsed on the
+    # calling thread.
+
+    def __init__(self, workers=0):
+        self.pool = None
+        if workers > 1 and (os.cpu_count() or 1) > 1:
+            self.pool = ProcessPoolExecutor(workers)
+
+    def __call__(self, extractor, content):
+        if self.pool is None:
+            return extractor(content)
+        return self.pool.submit(extractor, content).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
@@ -0,0 +1,177 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        if self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+
+class RetryBudget:
+    # Decides whether a failed fetch is tried again, shared by every fetch
+    # of a run. A page is fetched up to `tries` times. The n-th retry of a
+    # page first waits a random time of up to backoff * 2**(n - 1) seconds
+    # (at most max_wait), and retries stop for the whole run once `retries`
+    # of them have been made or `seconds` have passed since the budget was
+    # made, so a flaky host can not stretch a run by hours.
+
+    def __init__(self, tries=1, retries=None, seconds=None, backoff=1.0,
+                 max_wait=60.0):
+        self.tries = tries
+        self.retries = retries
+        self.seconds = seconds
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        if self.seconds is None:
+            return float('inf')
+        return self.seconds - (time.monotonic() - self.started)
+
+    def retry(self, attempt):
+        # Called before retry number attempt (1 for the second try); waits
+        # and returns True, or returns False when the budget is spent.
+        with self.lock:
+            if self.retries is not None:
+                if self.retries <= 0:
+                    return False
+                self.retries -= 1
+        wait = random.uniform(
+            0,
+            min(self.max_wait, self.backoff * 2 ** (attempt - 1)),
+        )
+        if wait >= self.remaining():
+            return False
+        time.sleep(wait)
+        return True
+
+
+def make_session(concurrency):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=max(concurrency, 1),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_all(items, func, concurrency=1, bar=None):
+    items = list(items)
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        futures = {
+            pool.submit(func, item): i
+            for i, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if bar is not None:
+                bar.update()
+    return results
+
+
+def add_fetch_arguments(parser):
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        help='number of ad pages fetched at the same time',
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=2.0,
+        help='requests per second allowed for each host',
+    )
+    parser.add_argument(
+        '--burst',
+        type=int,
+        default=2,
+        help='requests each host may receive back to back',
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=0,
+        help='processes that parse fetched ad pages (with fewer than 2, or '
+        'on one CPU, they are parsed on the fetching threads)',
+    )
+    parser.add_argument(
+        '--backoff',
+        type=float,
+        default=1.0,
+        help='seconds the first retry of a page waits at most; each further '
+        'retry waits up to twice as long (with random jitter)',
+    )
+    parser.add_argument(
+        '--retry-budget',
+        type=int,
+        default=200,
+        help='retries allowed over the whole run',
+    )
+    parser.add_argument(
+        '--retry-time',
+        type=float,
+        default=1800,
+        help='seconds after the first fetch beyond which failed pages are '
+        'not retried',
+    )
+
+
+def retry_budget_from_args(cfg):
+    return RetryBudget(
+        cfg.tries,
+        cfg.retry_budget,
+        cfg.retry_time,
+        cfg.backoff,
+    )
@@ -0,0 +1,129 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import tomllib
+
+import pandas as pd
+
+logger = logging.getLogger(__file__)
+
+COUNTRIES_PATH = Path(__file__).parent / '..' / 'config' / 'countries.toml'
+CACHE_PATH = Path(__file__).parent / '..' / '.cache' / 'gazetteer.json'
+
+# Gazetteers already built, by path, with the mtime of their file.
+_loaded = {}
+_loading = threading.Lock()
+
+# Upper-case words at the start of a location, for the ones the gazetteer
+# does not know.
+LEADING_CAPS = re.compile(r'^[A-Z\s]*')
+ALL_CAPS = re.compile(r'^[A-Z\s]*$')
+
+
+def _words(s):
+    return s.upper().split()
+
+
+def legacy_country(location):
+    # What the cleaners reported before the gazetteer: the whole location
+    # when it is all capitals, else its capitals minus the capital that
+    # starts the next (mixed-case) word.
+    if ALL_CAPS.match(location):
+        return location.strip()
+    return LEADING_CAPS.match(location).group()[:-2].strip()
+
+
+class Gazetteer:
+    # Maps locations such as "KOREA, REPUBLIC OF Seoul Seoul" to a country
+    # name. Every distinct location is resolved once and the results are
+    # kept in a json file, tied to the digest of countries.toml, so later
+    # runs only resolve locations they have not seen.
+
+    def __init__(self, path=COUNTRIES_PATH, cache_path=CACHE_PATH):
+        with open(path, 'rb') as fh:
+            raw = fh.read()
+        self.digest = hashlib.sha256(raw).hexdigest()[:16]
+        countries = tomllib.loads(raw.decode())['countries']
+        self.names = {}
+        for name, spellings in countries.items():
+            for spelling in [name, *spellings]:
+                self.names[tuple(_words(spelling))] = name
+        self.longest = max(len(words) for words in self.names)
+        self.cache_path = cache_path
+        self.resolved = self._load_cache()
+        self.unsaved = False
+
+    def _load_cache(self):
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path) as fh:
+                cache = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if cache.get('digest') != self.digest:
+            return {}
+        return cache['locations']
+
+    def save(self):
+        if self.cache_path is None or not self.unsaved:
+            return
+        path = Path(self.cache_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as fh:
+            json.dump({'digest': self.digest, 'locations': self.resolved}, fh)
+        os.replace(tmp, path)
+        self.unsaved = False
+
+    def country(self, location):
+        words = _words(location)
+        for n in range(min(len(words), self.longest), 0, -1):
+            name = self.names.get(tuple(words[:n]))
+            if name is not None:
+                return name
+        fallback = legacy_country(location)
+        logger.warning(
+            f'Unknown country in location {location!r}, using {fallback!r}'
+        )
+        return fallback
+
+    def resolve(self, locations):
+        # locations is a Series; returns the country of each, looking up
+        # every distinct location once.
+        new = [
+            location for location in locations.dropna().unique()
+            if location not in self.resolved
+        ]
+        for location in new:
+            self.resolved[location] = self.country(location)
+        if new:
+            self.unsaved = True
+            self.save()
+        return locations.map(self.resolved)
+
+
+def unique_lists(exploded, index):
+    # Collects exploded values (indexed by row position) back into one list
+    # per row, dropping repeats and keeping the order they came in.
+    frame = pd.DataFrame({
+        'row': exploded.index,
+        'value': exploded.to_numpy(),
+    }).drop_duplicates()
+    lists = frame.groupby('row', sort=True)['value'].agg(list)
+    return pd.Series(lists.to_numpy(), index=index, dtype=object)
+
+
+def load_gazetteer(path=COUNTRIES_PATH):
+    # Built once per process, and again when countries.toml changes, so a
+    # long-running process (the service) picks up edits.
+    stamp = os.stat(path).st_mtime_ns
+    with _loading:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != stamp:
+            loaded = _loaded[path] = (stamp, Gazetteer(path))
+    return loaded[1]
@@ -0,0 +1,235 @@
+from pathlib import Path
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+
+from stages import record_fetch
+
+logger = logging.getLogger(__file__)
+
+CachedResponse = namedtuple(
+    'CachedResponse',
+    ['url', 'status_code', 'content', 'from_cache'],
+)
+
+
+class OfflineCacheMiss(Exception):
+    pass
+
+
+def _replace(path, data):
+    # Writes data to path through a temporary file of its own, so that
+    # threads fetching the same url (or pages with the same body) do not
+    # write into each other's file; the last one to finish wins.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class ResponseCache:
+    # Layout:
+    #   <dir>/index/<sha256(url)>.json      url -> body digest + validators
+    #   <dir>/objects/<xx>/<sha256(body)>.z zlib-compressed body, shared by
+    #                                       every url with the same content
+
+    def __init__(
+        self,
+        directory,
+        ttl=7 * 24 * 3600,
+        max_bytes=1024 * 2**20,
+        offline=False,
+    ):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.index = self.directory / 'index'
+        self.objects = self.directory / 'objects'
+        self.index.mkdir(parents=True, exist_ok=True)
+        self.objects.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.index / f'{key}.json'
+
+    def _object_path(self, digest):
+        return self.objects / digest[:2] / f'{digest}.z'
+
+    def _load_entry(self, url):
+        path = self._entry_path(url)
+        try:
+            with open(path) as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get('url') != url:
+            return None
+        if not self._object_path(entry['digest']).exists():
+            return None
+        return entry
+
+    def _save_entry(self, entry):
+        _replace(self._entry_path(entry['url']), json.dumps(entry).encode())
+
+    def _read_body(self, entry):
+        with open(self._object_path(entry['digest']), 'rb') as fh:
+            return zlib.decompress(fh.read())
+
+    def _write_body(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            _replace(path, zlib.compress(content, 6))
+        return digest
+
+    def get(self, session, url, on_network=None, **kwargs):
+        entry = self._load_entry(url)
+        now = time.time()
+        if entry is not None and (
+            self.offline or now - entry['fetched'] < self.ttl
+        ):
+            return CachedResponse(url, 200, self._read_body(entry), True)
+        if self.offline:
+            raise OfflineCacheMiss(f'{url} is not in the response cache')
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        if on_network is not None:
+            on_network()
+        response = session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            entry['fetched'] = now
+            self._save_entry(entry)
+            return CachedResponse(url, 200, self._read_body(entry), False)
+        if response.status_code == 200:
+            self._save_entry(
+                {
+                    'url': url,
+                    'digest': self._write_body(response.content),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'fetched': now,
+                }
+            )
+        return CachedResponse(
+            url,
+            response.status_code,
+            response.content,
+            False,
+        )
+
+    def prune(self):
+        entries = []
+        for path in self.index.glob('*.json'):
+            try:
+                with open(path) as fh:
+                    entries.append((path, json.load(fh)))
+            except json.JSONDecodeError:
+                path.unlink()
+        sizes = {}
+        for path in self.objects.glob('*/*.z'):
+            sizes[path.stem] = path.stat().st_size
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently fetched urls until the bodies that are
+        # still referenced fit in the budget.
+        entries.sort(key=lambda e: e[1]['fetched'])
+        refs = {}
+        for _, entry in entries:
+            refs[entry['digest']] = refs.get(entry['digest'], 0) + 1
+        for path, entry in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            digest = entry['digest']
+            refs[digest] -= 1
+            if refs[digest] == 0 and digest in sizes:
+                self._object_path(digest).unlink(missing_ok=True)
+                total -= sizes.pop(digest)
+        for digest in set(sizes) - set(d for d, n in refs.items() if n):
+            self._object_path(digest).unlink(missing_ok=True)
+        logger.info(f'Pruned response cache to {total} bytes')
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        '--cache-dir',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'http',
+    )
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=7 * 24,
+        help='hours before a cached page is revalidated',
+    )
+    parser.add_argument(
+        '--cache-max-size',
+        type=float,
+        default=1024,
+        help='megabytes of compressed pages to keep',
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='serve pages only from the cache, never touch the network',
+    )
+
+
+def cache_from_args(cfg):
+    if cfg.no_cache:
+        return None
+    return ResponseCache(
+        cfg.cache_dir,
+        ttl=cfg.cache_ttl * 3600,
+        max_bytes=int(cfg.cache_max_size * 2**20),
+        offline=cfg.offline,
+    )
+
+
+def fetch(cache, session, url, on_network=None):
+    # Latency is measured from when on_network (rate limiting, login) is
+    # done, so it only covers the request itself.
+    sent = []
+
+    def network():
+        if on_network is not None:
+            on_network()
+        sent.append(time.perf_counter())
+
+    if cache is None:
+        network()
+        response = session.get(url)
+        response = CachedResponse(
+            url,
+            response.status_code,
+            response.content,
+            False,
+        )
+    else:
+        response = cache.get(session, url, on_network=network)
+    if sent:
+        record_fetch(time.perf_counter() - sent[0], len(response.content),
+                     False)
+    else:
+        record_fetch(0.0, 0, True)
+    return response
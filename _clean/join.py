@@ -1,20 +1,353 @@
-import argparse
+from collections import defaultdict, namedtuple
 from pathlib import Path
+import argparse
+import csv
+import os
 
+import numpy as np
 import pandas as pd
 
+from minhash import LSHIndex, MinHasher, normalize, similarity
+from storage import read_frame, write_frame
+from streaming import concat_csv, sorted_groups
+
 parser = argparse.ArgumentParser()
 parser.add_argument('output', type=lambda s: Path(s))
+parser.add_argument('--parquet', action='store_true')
+parser.add_argument(
+    '--dedupe',
+    action='store_true',
+    help='merge postings that appear in more than one of the files',
+)
 parser.add_argument('files', nargs=argparse.REMAINDER, type=lambda s: Path(s))
-cfg = parser.parse_args()
 
-dataframes = []
-for file in cfg.files:
-    data = pd.read_csv(file)
-    dataframes.append(data)
+EXCEL_SORT_KEYS = ['Letter Submission Deadline Date', 'Department Name']
+
+ADMIN_SORT_KEYS = [
+    'Letter Submission Deadline Date',
+    'Application Status',
+    'Institution or Organization Name',
+    'Department Name',
+    'Job ID #',
+    'Job Title',
+    'Additional Instructions',
+    'Ad Webpage Link',
+]
+
+# Columns of to_admin.csv that the pipeline leaves empty for the admin.
+MANUAL_COLUMNS = ['Application Status', 'Additional Instructions']
+
+INSTITUTION = 'Institution or Organization Name'
+DEADLINE = 'Letter Submission Deadline Date'
+JOB_ID = 'Job ID #'
+LINK = 'Ad Webpage Link'
+
+# Estimated Jaccard similarity of title and department above which two
+# postings of the same institution and deadline are the same job.
+DUPLICATE_THRESHOLD = 0.5
+
+# The lower similarity enough for the only two postings of an institution
+# and deadline (one per source). Below it they are different jobs, e.g. a
+# visiting scholars programme and a nonacademic post of the same bank.
+FORCED_THRESHOLD = 0.35
+
+# Deadlines starting with this are placeholders (no date was found), and
+# do not count as evidence that two postings are the same job.
+NO_DEADLINE = '9999'
+
+# One pair of postings, in sources first < second, that are the same job,
+# and the record that replaces them.
+Duplicate = namedtuple(
+    'Duplicate',
+    ['first', 'first_id', 'second', 'second_id', 'score', 'record'],
+)
+
+
+def institution_key(name):
+    if pd.isna(name):
+        return ''
+    key = normalize(name)
+    return key[4:] if key.startswith('the ') else key
+
+
+def merge_records(first, second):
+    # The fields of first, with its missing ones taken from second and the
+    # links to both ads.
+    record = first.where(first.notna(), second)
+    links = [link for link in (first[LINK], second[LINK]) if pd.notna(link)]
+    record[LINK] = '\n'.join(dict.fromkeys(links)) if links else np.nan
+    return record.to_dict()
+
+
+def find_duplicates(frames, threshold=DUPLICATE_THRESHOLD, hasher=None):
+    # Finds the postings listed in more than one frame (one per source, in
+    # the excel layout). Candidates are blocked by normalized institution
+    # and deadline and then drawn from an LSH index of the MinHash
+    # signatures of title and department, so postings are only compared
+    # with the few that share a block and a band. When a block holds
+    # exactly one posting of each of two sources (and the deadline is a real
+    # date), they are compared whether or not they share a band, and taken
+    # to be the same job from FORCED_THRESHOLD on.
+    hasher = hasher or MinHasher()
+    index = LSHIndex()
+    blocks = defaultdict(lambda: defaultdict(list))
+    signatures = {}
+    for source, frame in enumerate(frames):
+        texts = (
+            frame['Job Title'].fillna('') + ' '
+            + frame['Department Name'].fillna('')
+        )
+        for position, (institution, deadline, text) in enumerate(zip(
+            frame[INSTITUTION].map(institution_key),
+            frame[DEADLINE],
+            texts,
+        )):
+            if not institution or pd.isna(deadline):
+                continue
+            block = (institution, deadline)
+            item = (source, position)
+            blocks[block][source].append(position)
+            signatures[item] = hasher.signature(text)
+            if signatures[item] is not None:
+                index.add(item, block, signatures[item])
+
+    pairs = {
+        tuple(sorted(pair)) for pair in index.candidates()
+        if pair[0][0] != pair[1][0]
+    }
+    forced = set()
+    for (_, deadline), members in blocks.items():
+        if str(deadline).startswith(NO_DEADLINE):
+            continue
+        alone = sorted(s for s, ps in members.items() if len(ps) == 1)
+        for i, first in enumerate(alone):
+            for second in alone[i + 1:]:
+                forced.add(
+                    ((first, members[first][0]), (second, members[second][0]))
+                )
+
+    scored = []
+    for a, b in pairs | forced:
+        score = similarity(signatures[a], signatures[b])
+        if score >= threshold or (
+            (a, b) in forced and score >= FORCED_THRESHOLD
+        ):
+            scored.append((-score, a, b))
+    scored.sort()
+
+    duplicates = []
+    used = set()
+    for score, a, b in scored:
+        if a in used or b in used:
+            continue
+        used.update([a, b])
+        first = frames[a[0]].iloc[a[1]]
+        second = frames[b[0]].iloc[b[1]]
+        duplicates.append(Duplicate(
+            a[0],
+            str(first[JOB_ID]),
+            b[0],
+            str(second[JOB_ID]),
+            -score,
+            merge_records(first, second),
+        ))
+    return duplicates
+
+
+def _targets(duplicates):
+    # Which row of which source each merged record replaces: the one of the
+    # first source, or that of the second when the first is not there.
+    return (
+        {(d.first, d.first_id): d for d in duplicates},
+        {(d.second, d.second_id): d for d in duplicates},
+    )
+
+
+def merge_duplicates(frames, duplicates):
+    # Replaces each duplicate pair in frames by its merged record.
+    _, seconds = _targets(duplicates)
+    frames = [frame.copy() for frame in frames]
+    ids = [frame[JOB_ID].astype(str) for frame in frames]
+    present = {
+        (source, id) for source, frame_ids in enumerate(ids)
+        for id in frame_ids
+    }
+    drop = [pd.Series(False, index=frame.index) for frame in frames]
+    for (source, id), duplicate in seconds.items():
+        if (duplicate.first, duplicate.first_id) in present:
+            drop[source] |= ids[source] == id
+            target = (duplicate.first, duplicate.first_id)
+        else:
+            target = (source, id)
+        frame = frames[target[0]]
+        rows = ids[target[0]] == target[1]
+        for column, value in duplicate.record.items():
+            if isinstance(value, str) and frame[column].dtype != object:
+                frame[column] = frame[column].astype(object)
+            frame.loc[rows, column] = value
+    return [frame[~d] for frame, d in zip(frames, drop)]
+
+
+def duplicates_report(duplicates, names):
+    return pd.DataFrame(
+        [
+            {
+                INSTITUTION: d.record[INSTITUTION],
+                DEADLINE: d.record[DEADLINE],
+                'first': names[d.first],
+                'first Job ID #': d.first_id,
+                'second': names[d.second],
+                'second Job ID #': d.second_id,
+                'score': d.score,
+            }
+            for d in duplicates
+        ],
+        columns=[
+            INSTITUTION, DEADLINE, 'first', 'first Job ID #', 'second',
+            'second Job ID #', 'score',
+        ],
+    ).sort_values([DEADLINE, INSTITUTION], kind='stable')
+
+
+def excel_outputs(formatted):
+    # The excel and academic outputs of a cleaner's formatted frame (sorted,
+    # with an ACADEMIC column).
+    return {
+        'excel': formatted.drop('ACADEMIC', axis=1).reset_index(drop=True),
+        'academic': formatted[formatted['ACADEMIC']].drop(
+            'ACADEMIC',
+            axis=1,
+        ).reset_index(drop=True),
+    }
+
+
+def join(dataframes, duplicates=()):
+    if duplicates:
+        dataframes = merge_duplicates(dataframes, duplicates)
+    return pd.concat(dataframes).reset_index(drop=True)
+
+
+def find_duplicates_csv(paths, threshold=DUPLICATE_THRESHOLD):
+    # find_duplicates over csv files sorted by deadline (the excel files),
+    # one deadline at a time: postings are only blocked together when they
+    # share one, so this finds the same pairs with only that deadline's
+    # postings in memory.
+    duplicates = []
+    for header, rows in sorted_groups(paths, [DEADLINE]):
+        frames = [
+            pd.DataFrame(r, columns=header, dtype=object) for r in rows
+        ]
+        frames = [frame.where(frame != '') for frame in frames]
+        duplicates += find_duplicates(frames, threshold)
+    return duplicates
+
+
+def join_csv(paths, path, duplicates=()):
+    # join() for csv files, row by row. Rows keep the text they were
+    # written with; merged records are written as to_csv would.
+    firsts, seconds = _targets(duplicates)
+    with open(paths[0], newline='') as fh:
+        header = next(csv.reader(fh))
+    column = header.index(JOB_ID)
+    # The first postings of the pairs that are in the files.
+    present = set()
+    for source, source_path in enumerate(paths):
+        with open(source_path, newline='') as fh:
+            rows = csv.reader(fh)
+            next(rows)
+            present.update(
+                key for key in ((source, row[column]) for row in rows)
+                if key in firsts
+            )
+
+    def record(duplicate):
+        return [
+            '' if pd.isna(duplicate.record[c]) else str(duplicate.record[c])
+            for c in header
+        ]
+
+    def transform(source, row):
+        key = (source, row[column])
+        if key in firsts:
+            return record(firsts[key])
+        if key in seconds:
+            duplicate = seconds[key]
+            if (duplicate.first, duplicate.first_id) in present:
+                return None
+            return record(duplicate)
+        return row
+
+    concat_csv(paths, path, transform)
+
+
+def sort_admin(data):
+    return data.sort_values(by=ADMIN_SORT_KEYS)
+
+
+def _keyed_rows(rows):
+    # Rows by Job ID #, with a count for ids that occur more than once.
+    seen = defaultdict(int)
+    keyed = {}
+    for row in rows:
+        key = (row[JOB_ID], seen[row[JOB_ID]])
+        seen[row[JOB_ID]] += 1
+        keyed[key] = row
+    return keyed
+
+
+def update_admin(path, new_path):
+    # Brings the admin sheet at path up to date with the one at new_path
+    # without rewriting it from scratch: rows of postings that are gone are
+    # dropped, the others keep their place and what was typed into
+    # MANUAL_COLUMNS (or into columns the admin added) and take everything
+    # else from the new sheet, and new postings are added at the end in
+    # the new sheet's order. Returns the number of rows added, removed and
+    # updated.
+    with open(path, newline='') as fh:
+        reader = csv.DictReader(fh)
+        old = _keyed_rows(reader)
+        old_header = reader.fieldnames
+    with open(new_path, newline='') as fh:
+        reader = csv.DictReader(fh)
+        new = _keyed_rows(reader)
+        new_header = reader.fieldnames
+    header = new_header + [c for c in old_header if c not in new_header]
+    manual = [c for c in header if c in MANUAL_COLUMNS or c not in new_header]
+    rows = []
+    updated = 0
+    for key, row in old.items():
+        if key not in new:
+            continue
+        merged = dict(new[key])
+        for column in manual:
+            if row.get(column):
+                merged[column] = row[column]
+        updated += any(merged.get(c, '') != row.get(c, '') for c in header)
+        rows.append(merged)
+    added = [row for key, row in new.items() if key not in old]
+    rows += added
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', newline='') as fh:
+        writer = csv.DictWriter(
+            fh,
+            header,
+            restval='',
+            lineterminator=os.linesep,
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, path)
+    return len(added), len(old) - (len(rows) - len(added)), updated
+
 
-data = pd.concat(dataframes).reset_index(drop=True)
+if __name__ == '__main__':
+    cfg = parser.parse_args()
+    dataframes = []
+    for file in cfg.files:
+        data = read_frame(file)
+        dataframes.append(data)
 
+    duplicates = find_duplicates(dataframes) if cfg.dedupe else ()
+    data = join(dataframes, duplicates)
 
-with open(cfg.output, 'w') as fh:
-    data.to_csv(fh, index=False)
+    write_frame(data, cfg.output, parquet=cfg.parquet)
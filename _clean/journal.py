@@ -0,0 +1,125 @@
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+
+from linkstore import ERROR
+
+logger = logging.getLogger(__file__)
+
+
+class FetchJournal:
+    # Append-only record of the fetch outcomes of a run, one json line per
+    # posting ({"id", "fingerprint", "record"}), written as each fetch
+    # finishes. A run that dies partway leaves its journal behind, and the
+    # next run takes the outcomes it holds (for postings whose fingerprint
+    # still matches) instead of fetching them again. Once the outcomes are
+    # in the state store, the journal is cleared.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries = self._load()
+        self.lock = threading.Lock()
+        self.fh = open(self.path, 'a')
+
+    def _load(self):
+        entries = {}
+        try:
+            with open(self.path) as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line of a run that was killed mid-write.
+                        continue
+                    entries[entry['id']] = entry
+        except FileNotFoundError:
+            pass
+        if entries:
+            logger.warning(
+                f'Resuming from {len(entries)} fetches in {self.path}'
+            )
+        return entries
+
+    def lookup(self, id, fingerprint):
+        # The journaled record of a posting, unless it failed or the
+        # posting has changed since.
+        entry = self.entries.get(str(id))
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        if entry['record']['status'] == ERROR:
+            return None
+        return entry['record']
+
+    def append(self, id, fingerprint, record):
+        entry = {'id': str(id), 'fingerprint': fingerprint, 'record': record}
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            self.entries[entry['id']] = entry
+            self.fh.write(line)
+            self.fh.flush()
+
+    def run(self, id, fingerprint, fetch):
+        # The journaled record of a posting, or else what fetch() gives,
+        # journaled.
+        record = self.lookup(id, fingerprint)
+        if record is None:
+            record = fetch()
+            self.append(id, fingerprint, record)
+        return record
+
+    def clear(self):
+        with self.lock:
+            self.fh.close()
+            self.entries = {}
+            os.remove(self.path)
+            self.fh = open(self.path, 'a')
+
+    def close(self):
+        self.fh.close()
+        if not self.entries and self.path.exists():
+            self.path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NoJournal:
+
+    def run(self, id, fingerprint, fetch):
+        return fetch()
+
+    def clear(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def add_journal_arguments(parser):
+    parser.add_argument(
+        '--journal',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'journal',
+        help='where fetch outcomes are written as they come in, so an '
+        'interrupted --getlinks run can be resumed',
+    )
+    parser.add_argument(
+        '--no-journal',
+        action='store_true',
+        help='do not keep or resume from a fetch journal',
+    )
+
+
+def journal_from_args(cfg, source):
+    if cfg.no_journal:
+        return NoJournal()
+    return FetchJournal(cfg.journal / f'{source}.jsonl')
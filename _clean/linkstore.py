@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+LINK_COLUMNS = ['text', 'link', 'status', 'fetched_at', 'error']
+
+# status is one of
+#   ok       the page was read and had application instructions/a link
+#   no-link  the page was read but had nothing to extract
+#   error    every try failed, error holds the last failure
+#   skipped  links were not fetched in this run
+OK = 'ok'
+NO_LINK = 'no-link'
+ERROR = 'error'
+SKIPPED = 'skipped'
+
+
+def link_record(status, text=None, link=None, error=None):
+    fetched_at = None
+    if status != SKIPPED:
+        fetched_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    return {
+        'text': text,
+        'link': link,
+        'status': status,
+        'fetched_at': fetched_at,
+        'error': error,
+    }
+
+
+def link_table(ids, records):
+    table = pd.DataFrame(
+        list(records),
+        columns=LINK_COLUMNS,
+        index=pd.Index(list(ids), name='ID'),
+    )
+    return table[~table.index.duplicated()]
+
+
+def skipped_table(ids):
+    return link_table(ids, (link_record(SKIPPED) for _ in ids))
+
+
+def with_skipped(table, ids):
+    # table with a skipped record for each of ids it does not have, in the
+    # order of ids. An empty table (a --chunksize batch with no stored
+    # links) is left out of the concat, which pandas warns about.
+    ids = pd.Index(list(ids), name='ID').drop_duplicates()
+    missing = ids[~ids.isin(table.index)]
+    if len(missing):
+        skipped = skipped_table(missing)
+        table = pd.concat([table, skipped]) if len(table) else skipped
+    return table.reindex(ids)
+
+
+def attach(frame, table, id_col, columns):
+    # One keyed lookup per column instead of one per row. columns maps table
+    # columns to the names they get in frame. The columns frame already has
+    # are shared, not copied.
+    frame = frame.copy(deep=False)
+    for column, name in columns.items():
+        frame[name] = frame[id_col].map(table[column])
+    return frame
@@ -0,0 +1,96 @@
+from collections import defaultdict
+import itertools
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+# Signature length and the number of LSH bands it is cut into. Two texts
+# with Jaccard similarity J share a band with probability
+# 1 - (1 - J ** (NUM_PERM // BANDS)) ** BANDS, i.e. mostly when J is above
+# (1 / BANDS) ** (BANDS / NUM_PERM), about 0.5.
+NUM_PERM = 64
+BANDS = 16
+
+# Shingle hashes are permuted modulo this prime, small enough for a * x + b
+# to fit in 64 bits.
+PRIME = (1 << 31) - 1
+
+NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    # Lower case ASCII words: accents dropped, '&' spelled out, anything
+    # else that is not a letter or digit turned into a space.
+    text = unicodedata.normalize('NFKD', text)
+    text = text.encode('ascii', 'ignore').decode().lower()
+    return NOT_ALNUM.sub(' ', text.replace('&', ' and ')).strip()
+
+
+def shingles(text, k=3):
+    # Character k-grams of every word, padded so that short words and
+    # word boundaries count too.
+    grams = set()
+    for word in normalize(text).split():
+        word = f' {word} '
+        grams.update(word[i:i + k] for i in range(len(word) - k + 1))
+    return grams
+
+
+class MinHasher:
+    # MinHash signatures: the fraction of positions where two signatures
+    # agree estimates the Jaccard similarity of the shingle sets. Each
+    # text is hashed once per hasher, so one hasher shared by several
+    # searches (e.g. for every person's postings) reuses the signatures.
+
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+        self.signatures = {}
+
+    def signature(self, text):
+        # None for a text without any shingle.
+        try:
+            return self.signatures[text]
+        except KeyError:
+            signature = self.signatures[text] = self._signature(text)
+            return signature
+
+    def _signature(self, text):
+        grams = shingles(text)
+        if not grams:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(g.encode()) % PRIME for g in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % PRIME
+        return permuted.min(axis=0)
+
+
+def similarity(a, b):
+    if a is None or b is None:
+        return 0.0
+    return float((a == b).mean())
+
+
+class LSHIndex:
+    # Buckets signatures by band, within a block: only items of the same
+    # block with one identical band are ever compared.
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.buckets = defaultdict(list)
+
+    def add(self, item, block, signature):
+        for band, values in enumerate(np.split(signature, self.bands)):
+            self.buckets[block, band, values.tobytes()].append(item)
+
+    def candidates(self):
+        pairs = set()
+        for items in self.buckets.values():
+            pairs.update(itertools.combinations(items, 2))
+        return pairs
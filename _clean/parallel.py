@@ -0,0 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# Each worker gets several chunks so a slow chunk does not hold up the rest.
+CHUNKS_PER_WORKER = 4
+
+# Only the deadline extraction, which scans the full text of every ad, goes
+# through map_chunks. The code and country parsing work on whole columns
+# (each distinct location is resolved once), which costs less than sending
+# chunks to worker processes.
+
+
+def map_chunks(func, frame, workers=1, **kwargs):
+    # func(chunk, **kwargs) must be a module-level function returning a
+    # Series or frame indexed like chunk; results come back in row order.
+    if workers <= 1 or len(frame) < 2 * workers:
+        return func(frame, **kwargs)
+    bounds = np.array_split(
+        np.arange(len(frame)),
+        min(len(frame), workers * CHUNKS_PER_WORKER),
+    )
+    chunks = [frame.iloc[b[0]:b[-1] + 1] for b in bounds if len(b)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(partial(func, **kwargs), chunks))
+    return pd.concat(results)
+
+
+def add_parallel_arguments(parser):
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='processes used for per-posting deadline extraction',
+    )
@@ -0,0 +1,495 @@
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import logging
+import tempfile
+
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+import clean_aea
+import clean_ejm
+from codes import CodeMatrix
+from deadlines import add_season_arguments
+from fetcher import add_fetch_arguments
+from httpcache import add_cache_arguments
+from journal import add_journal_arguments
+from join import (
+    ADMIN_SORT_KEYS,
+    EXCEL_SORT_KEYS,
+    duplicates_report,
+    find_duplicates,
+    find_duplicates_csv,
+    join,
+    join_csv,
+    sort_admin,
+    update_admin,
+)
+from minhash import MinHasher
+from parallel import add_parallel_arguments
+from rules import add_rules_arguments, current_people
+from search import add_search_arguments
+from snapshots import (
+    add_snapshot_arguments,
+    csv_rows,
+    frame_rows,
+    snapshots_from_args,
+)
+from stages import (
+    Profiler,
+    add_profile_arguments,
+    no_stage,
+    profiler_from_args,
+)
+from state import add_state_arguments
+from storage import (
+    add_storage_arguments,
+    file_digest,
+    input_cache_from_args,
+    write_frame,
+    write_parquet,
+)
+from streaming import sort_csv
+
+logger = logging.getLogger(__file__)
+
+root = Path(__file__).parent / '..'
+
+parser = argparse.ArgumentParser(description='Run the full cleaning pipeline')
+parser.add_argument(
+    '--aea',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'aea.csv',
+)
+parser.add_argument(
+    '--ejm',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'ejm.csv',
+)
+parser.add_argument(
+    '--output',
+    type=lambda s: Path(s),
+    default=root / 'output',
+)
+parser.add_argument(
+    '--admin',
+    type=lambda s: Path(s),
+    default=root / 'to_admin.csv',
+)
+parser.add_argument(
+    '--no-intermediate',
+    action='store_true',
+    help='skip the per-source excel/academic files and output/excel/all',
+)
+parser.add_argument(
+    '--serial',
+    action='store_true',
+    help='clean AEA and EJM one after the other in this process',
+)
+parser.add_argument(
+    '--keep-duplicates',
+    action='store_true',
+    help='do not merge postings that are listed both on AEA and on EJM',
+)
+parser.add_argument(
+    '--update-admin',
+    action='store_true',
+    help='update the existing admin sheet in place, keeping what was typed '
+    'into it, instead of writing a new one',
+)
+parser.add_argument('--getlinks', action='store_true')
+parser.add_argument('--tries', type=int, default=1)
+add_cache_arguments(parser)
+add_fetch_arguments(parser)
+add_journal_arguments(parser)
+add_season_arguments(parser)
+add_rules_arguments(parser)
+add_search_arguments(parser)
+add_snapshot_arguments(parser)
+add_state_arguments(parser)
+add_storage_arguments(parser)
+add_parallel_arguments(parser)
+add_profile_arguments(parser)
+parser.add_argument(
+    '--chunksize',
+    type=int,
+    help='stream the exports in batches of this many postings, appending '
+    'to the outputs and sorting them on disk at the end',
+)
+
+Source = namedtuple(
+    'Source',
+    ['load', 'iter_chunks', 'clean', 'write', 'paths'],
+)
+
+SOURCES = {
+    'aea': Source(
+        clean_aea.load_aea,
+        clean_aea.iter_aea,
+        clean_aea.clean_aea,
+        clean_aea.write_aea,
+        clean_aea.aea_paths,
+    ),
+    'ejm': Source(
+        clean_ejm.load_ejm,
+        clean_ejm.iter_ejm,
+        clean_ejm.clean_ejm,
+        clean_ejm.write_ejm,
+        clean_ejm.ejm_paths,
+    ),
+}
+
+# Outputs that are sorted as a whole, and so can't be appended to directly.
+SORTED_KINDS = ['excel', 'academic']
+
+
+def source_cfg(cfg, name):
+    options = vars(cfg).copy()
+    options.update(
+        csvfile=getattr(cfg, name),
+        output=cfg.output / 'excel' / name,
+        discarded=cfg.output / 'discarded' / name,
+        academic=cfg.output / 'academic' / name,
+        verbose=cfg.output / 'verbose' / name,
+    )
+    return argparse.Namespace(**options)
+
+
+def person_cfg(cfg, person):
+    # cfg for one person's outputs, which are laid out as the pipeline's
+    # own under output/people/<person>.
+    output = cfg.output / 'people' / person
+    options = vars(cfg).copy()
+    options.update(output=output, admin=output / cfg.admin.name)
+    return argparse.Namespace(**options)
+
+
+def run_source(name, cfg, stage=no_stage):
+    source = SOURCES[name]
+    scfg = source_cfg(cfg, name)
+    with stage('load'):
+        raw = source.load(
+            scfg.csvfile,
+            scfg.csv_engine,
+            input_cache_from_args(scfg),
+        )
+    outputs = source.clean(raw, scfg, stage)
+    kinds = ['discarded', 'verbose', 'applications', 'codes']
+    if not cfg.no_intermediate:
+        kinds += SORTED_KINDS
+    with stage('write'):
+        source.write({kind: outputs[kind] for kind in kinds}, scfg)
+        if not cfg.no_intermediate:
+            for person, frames in outputs['people'].items():
+                source.write(frames, source_cfg(person_cfg(cfg, person), name))
+    return outputs['excel'], outputs['academic'], outputs['people']
+
+
+def stream_source(name, cfg, spool, stage=no_stage):
+    # Cleans one batch of postings at a time. The unsorted outputs are
+    # appended to their files; the excel/academic rows are appended to
+    # spool files and sorted on disk once every batch is done, and the code
+    # matrices (a few bytes per posting) are kept and written at the end.
+    # Returns the paths of the sorted files, the names of their numeric
+    # columns and the paths of each person's sorted files.
+    source = SOURCES[name]
+    scfg = source_cfg(cfg, name)
+    spool = spool / name
+    chunks = source.iter_chunks(scfg.csvfile, cfg.chunksize)
+    seen = set()
+    numeric = set()
+    codes = []
+    people = set()
+    append = False
+    while True:
+        with stage('load'):
+            raw = next(chunks, None)
+        if raw is None:
+            break
+        outputs = source.clean(raw, scfg, stage)
+        applications = outputs['applications']
+        outputs['applications'] = applications[
+            ~applications['ID'].isin(seen)
+        ]
+        seen.update(applications['ID'])
+        codes.append(outputs['codes'])
+        excel = outputs['excel']
+        numeric = {c for c in excel.columns if is_numeric_dtype(excel[c])}
+        with stage('write'):
+            source.write(
+                {
+                    kind: outputs[kind]
+                    for kind in ['discarded', 'verbose', 'applications']
+                },
+                scfg,
+                append=append,
+            )
+            for kind in SORTED_KINDS:
+                write_frame(
+                    outputs[kind],
+                    spool / f'{kind}.unsorted.csv',
+                    append=append,
+                )
+            for person, frames in outputs['people'].items():
+                for kind in SORTED_KINDS:
+                    write_frame(
+                        frames[kind],
+                        spool / 'people' / person / f'{kind}.unsorted.csv',
+                        append=append,
+                    )
+                people.add(person)
+        append = True
+    with stage('write'):
+        source.write({'codes': CodeMatrix.concat(codes)}, scfg)
+    with stage('sort'):
+        sorted_paths = sort_spool(source.paths(scfg), spool, numeric, cfg)
+        people_paths = {
+            person: sort_spool(
+                source.paths(source_cfg(person_cfg(cfg, person), name)),
+                spool / 'people' / person,
+                numeric,
+                cfg,
+            )
+            for person in sorted(people)
+        }
+    return sorted_paths, numeric, people_paths
+
+
+def sort_spool(paths, spool, numeric, cfg):
+    # Sorts the excel/academic rows spooled in spool into paths (or, with
+    # --no-intermediate, into spool) and returns where they went.
+    sorted_paths = {}
+    for kind in SORTED_KINDS:
+        path = paths[kind]
+        if cfg.no_intermediate:
+            path = spool / f'{kind}.csv'
+        sort_csv(
+            [spool / f'{kind}.unsorted.csv'],
+            path,
+            EXCEL_SORT_KEYS,
+            numeric,
+            cfg.chunksize,
+            spool,
+        )
+        sorted_paths[kind] = path
+    return sorted_paths
+
+
+def run_in_worker(func, name, cfg, *args):
+    # A worker process profiles into its own Profiler and hands the report
+    # back with the results.
+    if cfg.profile is None:
+        return func(name, cfg, *args), None
+    profiler = Profiler(cfg.profile_dump)
+    with profiler.active():
+        results = func(name, cfg, *args, stage=profiler)
+    return results, profiler.report(pstats=True)
+
+
+def run_sources(func, cfg, stage, *args):
+    # A StageTimer passed as stage only sees the per-source stages with
+    # --serial; a Profiler also gets them from the worker processes.
+    if cfg.serial:
+        return {
+            name: func(name, cfg, *args, stage=stage)
+            for name in SOURCES
+        }
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(SOURCES)) as pool:
+        futures = {
+            name: pool.submit(run_in_worker, func, name, cfg, *args)
+            for name in SOURCES
+        }
+        for name, future in futures.items():
+            results[name], report = future.result()
+            if report is not None and isinstance(stage, Profiler):
+                stage.merge(report)
+    return results
+
+
+def write_duplicates(duplicates, cfg):
+    # The pairs that were merged, for checking by hand.
+    write_frame(
+        duplicates_report(duplicates, list(SOURCES)),
+        cfg.output / 'verbose' / 'all' / 'duplicates.csv',
+    )
+
+
+def record_snapshot(rows, cfg):
+    # rows maps each source to the rows of its excel output.
+    store = snapshots_from_args(cfg)
+    if store is None:
+        return
+    exports = {}
+    for name in SOURCES:
+        path = getattr(cfg, name)
+        exports[name] = f'{path.name} {file_digest(path)[:12]}'
+    with store:
+        run = store.record(rows, exports)
+        previous = store.latest(2)[0] if run > 1 else 0
+        changes = Counter(change for change, *_ in store.diff(previous, run))
+    logger.warning(
+        f'Recorded run {run} in {cfg.snapshots}: {changes["added"]} added, '
+        f'{changes["removed"]} removed, {changes["changed"]} changed postings'
+    )
+
+
+def write_admin(write, cfg):
+    # write(path) writes the new admin sheet. With --update-admin, an
+    # existing sheet is updated from it instead of replaced.
+    if not (cfg.update_admin and cfg.admin.exists()):
+        write(cfg.admin)
+        return
+    with tempfile.TemporaryDirectory(dir=cfg.output) as tmp:
+        new = Path(tmp) / cfg.admin.name
+        write(new)
+        added, removed, updated = update_admin(cfg.admin, new)
+    logger.warning(
+        f'Updated {cfg.admin}: {added} added, {removed} removed, '
+        f'{updated} updated rows'
+    )
+    if cfg.parquet:
+        write_parquet(
+            pd.read_csv(cfg.admin),
+            cfg.admin.with_suffix('.parquet'),
+        )
+
+
+def run(cfg, stage=no_stage):
+    if cfg.chunksize:
+        return run_streaming(cfg, stage)
+    results = run_sources(run_source, cfg, stage)
+    with stage('snapshot'):
+        record_snapshot(
+            {name: frame_rows(results[name][0]) for name in SOURCES},
+            cfg,
+        )
+    # Most of each person's postings are in the other searches too, and
+    # are hashed once.
+    hasher = MinHasher()
+    join_sources(
+        [results[name][0] for name in SOURCES],
+        [results[name][1] for name in SOURCES],
+        cfg,
+        stage,
+        hasher,
+    )
+    for person in results['aea'][2]:
+        join_sources(
+            [results[name][2][person]['excel'] for name in SOURCES],
+            [results[name][2][person]['academic'] for name in SOURCES],
+            person_cfg(cfg, person),
+            stage,
+            hasher,
+        )
+
+
+def join_sources(excels, academics, cfg, stage=no_stage, hasher=None):
+    # Merges the per-source excel and academic frames into the outputs
+    # under cfg.output and the admin sheet.
+    duplicates = []
+    with stage('dedupe'):
+        if not cfg.keep_duplicates:
+            duplicates = find_duplicates(excels, hasher=hasher)
+    with stage('join'):
+        excel = join(excels, duplicates)
+        academic = join(academics, duplicates)
+    outputs = {'academic': academic}
+    if not cfg.no_intermediate:
+        outputs['excel'] = excel
+    with stage('write'):
+        for kind, frame in outputs.items():
+            write_frame(
+                frame,
+                cfg.output / kind / 'all' / 'all.csv',
+                parquet=cfg.parquet,
+            )
+        write_duplicates(duplicates, cfg)
+    with stage('sort'):
+        admin = sort_admin(excel)
+    with stage('write'):
+        write_admin(
+            lambda path: write_frame(admin, path, parquet=cfg.parquet),
+            cfg,
+        )
+
+
+def run_streaming(cfg, stage=no_stage):
+    cfg.output.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cfg.output) as spool:
+        spool = Path(spool)
+        results = run_sources(stream_source, cfg, stage, spool)
+        numeric = set().union(*(n for _, n, _ in results.values()))
+        with stage('snapshot'):
+            record_snapshot(
+                {
+                    name: csv_rows(results[name][0]['excel'])
+                    for name in SOURCES
+                },
+                cfg,
+            )
+        join_sorted(
+            [results[name][0] for name in SOURCES],
+            numeric,
+            cfg,
+            spool,
+            stage,
+        )
+        for person in results['aea'][2]:
+            join_sorted(
+                [results[name][2][person] for name in SOURCES],
+                numeric,
+                person_cfg(cfg, person),
+                spool / 'people' / person,
+                stage,
+            )
+
+
+def join_sorted(paths, numeric, cfg, spool, stage=no_stage):
+    # join_sources for the sorted excel/academic files of each source
+    # (paths holds their paths by kind), on disk.
+    spool.mkdir(parents=True, exist_ok=True)
+    duplicates = []
+    with stage('dedupe'):
+        if not cfg.keep_duplicates:
+            duplicates = find_duplicates_csv(
+                [source['excel'] for source in paths]
+            )
+    joined = {}
+    with stage('join'):
+        for kind in SORTED_KINDS:
+            joined[kind] = cfg.output / kind / 'all' / 'all.csv'
+            if kind == 'excel' and cfg.no_intermediate:
+                joined[kind] = spool / 'excel.csv'
+            joined[kind].parent.mkdir(parents=True, exist_ok=True)
+            join_csv(
+                [source[kind] for source in paths],
+                joined[kind],
+                duplicates,
+            )
+    with stage('write'):
+        write_duplicates(duplicates, cfg)
+    with stage('sort'):
+        write_admin(
+            lambda path: sort_csv(
+                [joined['excel']],
+                path,
+                ADMIN_SORT_KEYS,
+                numeric,
+                cfg.chunksize,
+                spool,
+            ),
+            cfg,
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    cfg = parser.parse_args()
+    if cfg.chunksize and cfg.parquet:
+        parser.error('--chunksize can not write parquet outputs')
+    if cfg.people is not None and not current_people(cfg.people):
+        parser.error(f'--people: no <person>.toml in {cfg.people}')
+    with profiler_from_args(cfg, cfg.output) as stage:
+        run(cfg, stage)
@@ -0,0 +1,299 @@
+from pathlib import Path
+import ast
+import os
+import threading
+import tomllib
+
+import numpy as np
+import pandas as pd
+
+from gazetteer import load_gazetteer
+
+EXCLUDE_PATH = Path(__file__).parent / '..' / 'config' / 'exclude.toml'
+# One <person>.toml per person filtered for with --people.
+PEOPLE_DIR = Path(__file__).parent / '..' / 'config' / 'people'
+
+# Rules already compiled, by path, with what they were compiled from.
+_loaded = {}
+_loading = threading.Lock()
+
+
+# The yes/no findings of classify_aea and classify_ejm. Rather than a bool
+# column each, a cleaned frame keeps them as the bits of one uint16 FLAGS
+# column (bit i for FLAGS[i]); expand_flags turns them back into columns
+# for the outputs.
+FLAGS = [
+    'BAD COUNTRY',
+    'BAD JEL CODES',
+    'BAD EJMCAT CODES',
+    'POSTDOC',
+    'LECTURER',
+    'ASSISTANT PROF',
+    'ASSOCIATE PROF',
+    'FULL PROF',
+    'VISITING',
+]
+
+
+def pack_flags(flags, index):
+    # flags maps names in FLAGS to bool Series over index, taken by label:
+    # some come back in another order (any_in's are sorted by it).
+    packed = np.zeros(len(index), dtype=np.uint16)
+    for name, values in flags.items():
+        if not values.index.equals(index):
+            values = values.reindex(index, fill_value=False)
+        bit = np.uint16(1 << FLAGS.index(name))
+        packed |= np.where(values.to_numpy(dtype=bool), bit, np.uint16(0))
+    return pd.Series(packed, index=index, name='FLAGS')
+
+
+def replace_flags(packed, flags):
+    # A FLAGS column with the bits of the named flags set from flags.
+    cleared = np.uint16(sum(1 << FLAGS.index(name) for name in flags))
+    return (packed & ~cleared) | pack_flags(flags, packed.index)
+
+
+def flag(frame, name):
+    # The named flag of every row of a frame, from its column if it has
+    # one and from its FLAGS bit otherwise.
+    if name in frame.columns:
+        return frame[name].astype(bool)
+    bit = 1 << FLAGS.index(name)
+    return pd.Series(
+        (frame['FLAGS'].to_numpy() & bit) != 0,
+        index=frame.index,
+        name=name,
+    )
+
+
+def expand_flags(frame, names):
+    # A frame with the FLAGS column replaced by a bool column for each of
+    # names, in that order. A name the frame has a column for is moved
+    # there. The other columns are not copied.
+    columns = {}
+    for column in frame.columns:
+        if column == 'FLAGS':
+            for name in names:
+                columns[name] = flag(frame, name)
+        elif column not in names:
+            columns[column] = frame[column]
+    return pd.DataFrame(columns, index=frame.index, copy=False)
+
+
+class CodeSet:
+    # The entries of one exclude.toml list. Plain entries match exactly;
+    # entries ending in '*' (e.g. "C*") match every code starting with the
+    # rest and are kept in a prefix trie.
+
+    def __init__(self, entries):
+        self.exact = frozenset(e for e in entries if not e.endswith('*'))
+        self.trie = {}
+        for entry in entries:
+            if entry.endswith('*'):
+                node = self.trie
+                for char in entry[:-1]:
+                    node = node.setdefault(char, {})
+                node[None] = True
+
+    def __contains__(self, code):
+        if code in self.exact:
+            return True
+        node = self.trie
+        for char in code:
+            if None in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return None in node
+
+    def isin(self, values):
+        # values is a Series. It is factorized so that every distinct value
+        # is looked up once, and the answers are taken by category code
+        # (-1, for missing values, picks the trailing False).
+        codes, uniques = pd.factorize(values)
+        hit = np.array([u in self for u in uniques] + [False], dtype=bool)
+        return pd.Series(hit[codes], index=values.index)
+
+
+def any_in(lists, codes):
+    # For a Series of lists: does any element of each list belong to codes.
+    hit = codes.isin(lists.explode())
+    return hit.groupby(level=0).any()
+
+
+class DiscardRule:
+    # A boolean expression over the flag columns of a cleaned frame, e.g.
+    #
+    #   BAD_COUNTRY or (ACADEMIC and (VISITING or not POSTDOC))
+    #
+    # with `and`, `or`, `not` and parentheses. A name stands for the column
+    # (or the FLAGS bit) of the same name with underscores for spaces. It is
+    # parsed once and evaluated on whole columns.
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression, mode='eval').body
+        self.columns = set()
+        self._check(tree)
+        self.tree = tree
+
+    def _check(self, node):
+        if isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._check(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self._check(node.operand)
+        elif isinstance(node, ast.Name):
+            self.columns.add(node.id.replace('_', ' '))
+        else:
+            raise ValueError(
+                f'unsupported syntax in discard rule {self.expression!r}: '
+                f'{ast.unparse(node)}'
+            )
+
+    def _evaluate(self, node, frame):
+        if isinstance(node, ast.BoolOp):
+            values = [self._evaluate(v, frame) for v in node.values]
+            result = values[0]
+            for value in values[1:]:
+                if isinstance(node.op, ast.And):
+                    result = result & value
+                else:
+                    result = result | value
+            return result
+        if isinstance(node, ast.UnaryOp):
+            return ~self._evaluate(node.operand, frame)
+        return flag(frame, node.id.replace('_', ' '))
+
+    def with_flags(self, frame, flags):
+        # The rule on frame with the named flags taken from flags instead
+        # (e.g. one person's BAD COUNTRY). Only the columns the rule reads
+        # are gathered, not copied.
+        columns = {
+            name: frame[name]
+            for name in self.columns
+            if name in frame.columns and name not in flags
+        }
+        columns['FLAGS'] = replace_flags(frame['FLAGS'], flags)
+        return self(pd.DataFrame(columns, index=frame.index, copy=False))
+
+    def __call__(self, frame):
+        available = set(frame.columns)
+        if 'FLAGS' in available:
+            available.update(FLAGS)
+        missing = self.columns - available
+        if missing:
+            raise KeyError(f'discard rule needs columns {sorted(missing)}')
+        return pd.Series(
+            self._evaluate(self.tree, frame),
+            index=frame.index,
+            name='DISCARD',
+        )
+
+
+class ExclusionRules:
+
+    def __init__(self, config):
+        self.config = config
+        # Excluded countries may be written in any spelling the gazetteer
+        # knows; they are compared with the names it reports.
+        self.countries = CodeSet(
+            load_gazetteer().resolve(pd.Series(config['countries']))
+        )
+        self.jel_codes = CodeSet(config['jel_codes'])
+        self.ejmcats = CodeSet(config['ejmcats'])
+        self.discard = {
+            source: DiscardRule(expression)
+            for source, expression in config['discard'].items()
+        }
+
+
+def load_rules(path=EXCLUDE_PATH):
+    with open(path, 'rb') as fh:
+        return ExclusionRules(tomllib.load(fh))
+
+
+def load_person(path, base=EXCLUDE_PATH):
+    # One person's rules: anything their file leaves out (a list, or the
+    # discard rule of a source) is taken from exclude.toml.
+    with open(base, 'rb') as fh:
+        config = tomllib.load(fh)
+    with open(path, 'rb') as fh:
+        person = tomllib.load(fh)
+    discard = {**config['discard'], **person.pop('discard', {})}
+    config.update(person, discard=discard)
+    return ExclusionRules(config)
+
+
+def _current(path, stamp, load):
+    with _loading:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != stamp:
+            loaded = _loaded[path] = (stamp, load())
+    return loaded[1]
+
+
+def current_rules(path=EXCLUDE_PATH):
+    # load_rules(path), compiled on first use and kept until exclude.toml
+    # or the gazetteer its countries were resolved with changes.
+    stamp = (os.stat(path).st_mtime_ns, load_gazetteer().digest)
+    return _current(path, stamp, lambda: load_rules(path))
+
+
+def current_people(directory=PEOPLE_DIR, base=EXCLUDE_PATH):
+    # The rules of every person with a <person>.toml in directory, by
+    # person, each kept like current_rules until its file, exclude.toml or
+    # the gazetteer changes.
+    people = {}
+    for path in sorted(Path(directory).glob('*.toml')):
+        stamp = (
+            os.stat(path).st_mtime_ns,
+            os.stat(base).st_mtime_ns,
+            load_gazetteer().digest,
+        )
+        people[path.stem] = _current(
+            path,
+            stamp,
+            lambda: load_person(path, base),
+        )
+    return people
+
+
+def people_from_args(cfg):
+    if cfg.people is None:
+        return {}
+    return current_people(cfg.people)
+
+
+def surviving(frame, cfg, discards=()):
+    # The rows whose deadline and application link are worked out: the
+    # ones not discarded, since only those reach the excel outputs and
+    # to_admin.csv, or every row with --all-rows. discards are the DISCARD
+    # columns of other people's rules; rows any of them keeps are worked
+    # out too.
+    if cfg.all_rows:
+        return pd.Series(True, index=frame.index)
+    rows = ~frame['DISCARD']
+    for discard in discards:
+        rows |= ~discard
+    return rows
+
+
+def add_rules_arguments(parser):
+    parser.add_argument(
+        '--all-rows',
+        action='store_true',
+        help='also work out the deadlines and application links of '
+        'discarded postings, for verbose.csv and discarded.csv',
+    )
+    parser.add_argument(
+        '--people',
+        nargs='?',
+        const=PEOPLE_DIR,
+        type=lambda s: Path(s),
+        metavar='DIR',
+        help='also filter for every person with rules in DIR/<person>.toml '
+        '(default config/people), writing their outputs under '
+        'output/people/<person>',
+    )
@@ -0,0 +1,162 @@
+from pathlib import Path
+import argparse
+import hashlib
+import sqlite3
+
+# The any.field wording of an ad (ANY_FIELD_TEXT in the cleaners) as a
+# query on the index: LIKE finds the candidates through the trigram index,
+# and GLOB keeps the ones the case-sensitive regex would match ('.' is any
+# character but a newline).
+ANY_FIELD = ('%any_field%', '*any[^\n]field*')
+
+parser = argparse.ArgumentParser(
+    description='Search the text of the postings the cleaners have seen. '
+    'QUERY is an FTS5 query on substrings of three or more characters, '
+    'e.g. \'"any field"\', \'institution:harvard AND deadline\'.',
+)
+parser.add_argument('query')
+parser.add_argument('--source', choices=['aea', 'ejm'])
+parser.add_argument('--limit', type=int, default=20)
+
+
+def _text(value):
+    return value if isinstance(value, str) else ''
+
+
+class SearchIndex:
+    # Institution, title and full text of every posting the cleaners have
+    # seen, in an SQLite FTS5 table with the trigram tokenizer, so that any
+    # substring can be looked up. A posting is indexed again only when its
+    # text has changed since; postings that drop out of the exports stay.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The two cleaners may update the index from separate processes.
+        self.con = sqlite3.connect(self.path, timeout=60)
+        self.con.execute(
+            'CREATE TABLE IF NOT EXISTS postings ('
+            ' doc INTEGER PRIMARY KEY, source TEXT, id TEXT,'
+            ' fingerprint TEXT, link TEXT, UNIQUE (source, id))'
+        )
+        self.con.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS ads USING fts5('
+            ' source UNINDEXED, institution, title, text,'
+            " tokenize = 'trigram')"
+        )
+
+    def update(self, source, postings):
+        # postings yields (id, institution, title, text, link) tuples.
+        # Returns how many were (re)indexed.
+        changed = 0
+        with self.con:
+            for id, *fields, link in postings:
+                fields = [_text(f) for f in fields]
+                fingerprint = hashlib.sha1(
+                    '\0'.join(fields + [_text(link)]).encode()
+                ).hexdigest()
+                row = self.con.execute(
+                    'SELECT doc, fingerprint FROM postings'
+                    ' WHERE source = ? AND id = ?',
+                    (source, str(id)),
+                ).fetchone()
+                if row is not None and row[1] == fingerprint:
+                    continue
+                if row is None:
+                    doc = self.con.execute(
+                        'INSERT INTO postings (source, id, fingerprint, link)'
+                        ' VALUES (?, ?, ?, ?)',
+                        (source, str(id), fingerprint, link),
+                    ).lastrowid
+                else:
+                    doc = row[0]
+                    self.con.execute(
+                        'UPDATE postings SET fingerprint = ?, link = ?'
+                        ' WHERE doc = ?',
+                        (fingerprint, link, doc),
+                    )
+                    self.con.execute('DELETE FROM ads WHERE rowid = ?', (doc,))
+                self.con.execute(
+                    'INSERT INTO ads (rowid, source, institution, title, text)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (doc, source, *fields),
+                )
+                changed += 1
+        return changed
+
+    def matching(self, source, query):
+        # The ids of the postings of source whose text matches query, a
+        # (LIKE, GLOB) pair of patterns such as ANY_FIELD.
+        like, glob = query
+        return {
+            id
+            for (id,) in self.con.execute(
+                'SELECT postings.id FROM ads'
+                ' JOIN postings ON postings.doc = ads.rowid'
+                ' WHERE ads.source = ?'
+                ' AND ads.text LIKE ? AND ads.text GLOB ?',
+                (source, like, glob),
+            )
+        }
+
+    def search(self, query, source=None, limit=20):
+        # (source, id, institution, title, link, snippet) of the best
+        # matches of an FTS5 query, best first.
+        sql = (
+            'SELECT postings.source, postings.id, ads.institution, ads.title,'
+            " postings.link, snippet(ads, 3, '[', ']', '...', 40)"
+            ' FROM ads JOIN postings ON postings.doc = ads.rowid'
+            ' WHERE ads MATCH ?'
+        )
+        params = [query]
+        if source is not None:
+            sql += ' AND ads.source = ?'
+            params.append(source)
+        sql += ' ORDER BY rank LIMIT ?'
+        params.append(limit)
+        return self.con.execute(sql, params).fetchall()
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def add_search_arguments(parser):
+    parser.add_argument(
+        '--search-index',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'search.sqlite',
+        help='full-text index of the postings, for _clean/search.py',
+    )
+    parser.add_argument(
+        '--no-search-index',
+        action='store_true',
+        help='do not keep a full-text index of the postings',
+    )
+
+
+def search_index_from_args(cfg):
+    if cfg.no_search_index:
+        return None
+    return SearchIndex(cfg.search_index)
+
+
+if __name__ == '__main__':
+    add_search_arguments(parser)
+    cfg = parser.parse_args()
+    if cfg.no_search_index:
+        parser.error('--no-search-index leaves nothing to search')
+    with SearchIndex(cfg.search_index) as index:
+        try:
+            matches = index.search(cfg.query, cfg.source, cfg.limit)
+        except sqlite3.OperationalError as e:
+            parser.error(f'bad query {cfg.query!r}: {e}')
+    for source, id, institution, title, link, snippet in matches:
+        print(f'{source} {id}  {institution} - {title}')
+        print(f'  {link}')
+        print(f'  {" ".join(snippet.split())}')
@@ -0,0 +1,222 @@
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import io
+import json
+import logging
+import tempfile
+import threading
+import time
+import zipfile
+
+import api
+
+logger = logging.getLogger(__file__)
+
+parser = argparse.ArgumentParser(
+    description='Serve the cleaning pipeline over HTTP, keeping the '
+    'libraries, rules and caches loaded between runs. Other options are '
+    'passed on to the pipeline for every run.',
+)
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8750)
+parser.add_argument(
+    '--max-upload',
+    type=int,
+    default=256,
+    help='megabytes accepted in one request (default 256)',
+)
+
+# Uploaded form fields and the file each is saved as.
+UPLOADS = ['aea', 'ejm']
+
+
+def csv_engine(value):
+    if value not in ('c', 'pyarrow'):
+        raise ValueError('expected c or pyarrow')
+    return value
+
+
+# The options a request may set for its own run, and what turns a query
+# value into the option's value (None for on/off options, which take no
+# value). All others, including where the caches, stores and outputs are
+# and how hard hosts are hit, are the ones the service was started with.
+RUN_OPTIONS = {
+    'getlinks': None,
+    'tries': int,
+    'all-rows': None,
+    'keep-duplicates': None,
+    'no-intermediate': None,
+    'season-start': datetime.fromisoformat,
+    'season-end': datetime.fromisoformat,
+    'offline': None,
+    'csv-engine': csv_engine,
+    'parquet': None,
+    'chunksize': int,
+}
+
+
+class CleanerHandler(BaseHTTPRequestHandler):
+    # GET /health reports whether the service is up.
+    # POST /clean runs the pipeline on the exports uploaded as the aea and
+    # ejm fields of a multipart form (the service's own exports stand in
+    # for a missing one) and answers with a zip of the output tree and
+    # to_admin.csv; POST /admin answers with to_admin.csv only. The query
+    # string holds pipeline options, e.g. /clean?getlinks&tries=3.
+
+    server_version = 'econ-job-parser'
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/health':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        self._reply(
+            HTTPStatus.OK,
+            'application/json',
+            json.dumps({'status': 'ok', 'runs': self.server.runs}).encode(),
+        )
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ('/clean', '/admin'):
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            cfg = self._options(url.query)
+            uploads = self._uploads()
+        except ValueError as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            for name, data in uploads.items():
+                (tmp / f'{name}.csv').write_bytes(data)
+            try:
+                admin = self.server.run(tmp / 'run', cfg, {
+                    name: tmp / f'{name}.csv' for name in uploads
+                })
+            except Exception as e:
+                logger.exception('run failed')
+                self.send_error(
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    f'{type(e).__name__}: {e}',
+                )
+                return
+            if url.path == '/admin':
+                self._reply(HTTPStatus.OK, 'text/csv', admin.read_bytes())
+                return
+            self._reply(
+                HTTPStatus.OK,
+                'application/zip',
+                zip_tree(admin.parent),
+            )
+
+    def _options(self, query):
+        # The query string's options, set on top of the ones the service
+        # was started with. Values never reach the command line parser, so
+        # they can not smuggle in other options.
+        overrides = {}
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            name = name.replace('_', '-')
+            if name not in RUN_OPTIONS:
+                raise ValueError(f'option {name} can not be set per run')
+            convert = RUN_OPTIONS[name]
+            if convert is None:
+                if value:
+                    raise ValueError(f'option {name} takes no value')
+                value = True
+            else:
+                try:
+                    value = convert(value)
+                except ValueError as e:
+                    raise ValueError(f'option {name}: {e}') from None
+            overrides[name.replace('-', '_')] = value
+        cfg = api.options(self.server.args, **overrides)
+        # Worker processes would have to import everything again.
+        cfg.serial = True
+        # Uploads are not the season's downloads, which the snapshot store
+        # keeps for diffing.
+        cfg.no_snapshots = True
+        return cfg
+
+    def _uploads(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length > self.server.max_upload:
+            raise ValueError('upload too large')
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if not body:
+            return {}
+        if not content_type.startswith('multipart/form-data'):
+            raise ValueError('expected a multipart/form-data upload')
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+        )
+        uploads = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name not in UPLOADS:
+                raise ValueError(f'unexpected field {name!r}')
+            uploads[name] = part.get_payload(decode=True)
+        return uploads
+
+    def _reply(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CleanerServer(ThreadingHTTPServer):
+    # Requests are answered on their own threads, but runs take turns: they
+    # share the state store, the gazetteer and the fetch caches.
+
+    daemon_threads = True
+
+    def __init__(self, address, args=(), max_upload=256):
+        super().__init__(address, CleanerHandler)
+        self.args = list(args)
+        self.max_upload = max_upload * 2**20
+        self.runs = 0
+        self.lock = threading.Lock()
+
+    def run(self, directory, cfg, exports):
+        with self.lock:
+            start = time.perf_counter()
+            admin = api.run(directory, cfg=cfg, **exports)
+            self.runs += 1
+            logger.warning(
+                f'run {self.runs} took {time.perf_counter() - start:.1f}s'
+            )
+        return admin
+
+
+def zip_tree(directory):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for path in sorted(directory.rglob('*')):
+            if path.is_file():
+                archive.write(path, path.relative_to(directory))
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    cfg, args = parser.parse_known_args()
+    # Fail now on options the pipeline would reject on every run.
+    api.options(args)
+    api.warm()
+    server = CleanerServer((cfg.host, cfg.port), args, cfg.max_upload)
+    logger.warning(f'serving on http://{cfg.host}:{cfg.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,270 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+
+JOB_ID = 'Job ID #'
+
+# Columns of a diff, before the posting's own.
+DIFF_COLUMNS = ['Change', 'Source', 'ID', 'Changes']
+
+parser = argparse.ArgumentParser(
+    description='List the cleaned runs kept in the snapshot store, or what '
+    'changed between two of them.',
+)
+commands = parser.add_subparsers(dest='command', required=True)
+commands.add_parser('runs', help='list the recorded runs')
+diff_parser = commands.add_parser(
+    'diff',
+    help='postings added, removed or changed between two runs (by default '
+    'the last two) as csv',
+)
+diff_parser.add_argument('old', type=int, nargs='?')
+diff_parser.add_argument('new', type=int, nargs='?')
+diff_parser.add_argument(
+    '--output',
+    type=lambda s: Path(s),
+    help='write the diff here instead of to stdout',
+)
+
+
+def frame_rows(frame):
+    # The rows of a frame as dicts of the text to_csv writes for them.
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False)
+    buffer.seek(0)
+    rows = csv.reader(buffer)
+    header = next(rows)
+    return (dict(zip(header, row)) for row in rows)
+
+
+def csv_rows(path):
+    with open(path, newline='') as fh:
+        yield from csv.DictReader(fh)
+
+
+class SnapshotStore:
+    # Every cleaned run, as versions of the postings it kept (the rows of
+    # the per-source excel outputs), keyed by source and Job ID #. A
+    # version is valid from the run where a posting appeared or changed up
+    # to the run where it changed again or went away, so a run only writes
+    # the postings that differ from the one before, and a diff only reads
+    # the versions that start or end between its two runs.
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(
+            'CREATE TABLE IF NOT EXISTS runs ('
+            ' run INTEGER PRIMARY KEY, taken TEXT, exports TEXT);'
+            'CREATE TABLE IF NOT EXISTS versions ('
+            ' source TEXT, id TEXT, valid_from INTEGER, valid_to INTEGER,'
+            ' fingerprint TEXT, record TEXT);'
+            'CREATE INDEX IF NOT EXISTS versions_key'
+            ' ON versions (source, id, valid_from);'
+            'CREATE INDEX IF NOT EXISTS versions_from'
+            ' ON versions (valid_from);'
+            'CREATE INDEX IF NOT EXISTS versions_to ON versions (valid_to);'
+        )
+
+    def record(self, sources, exports=None):
+        # sources maps each source to the rows (dicts of text, as
+        # frame_rows and csv_rows give) of its run. Postings of those
+        # sources that are not in their rows are closed. Returns the run.
+        with self.con:
+            run = self.con.execute(
+                'INSERT INTO runs (taken, exports) VALUES (?, ?)',
+                (
+                    datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    json.dumps(exports or {}),
+                ),
+            ).lastrowid
+            self.con.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS seen ('
+                ' source TEXT, id TEXT, PRIMARY KEY (source, id))'
+            )
+            self.con.execute('DELETE FROM seen')
+            for source, rows in sources.items():
+                for row in rows:
+                    self._record_row(run, source, row)
+                self.con.execute(
+                    'UPDATE versions SET valid_to = ?'
+                    ' WHERE source = ? AND valid_to IS NULL AND NOT EXISTS ('
+                    '  SELECT 1 FROM seen'
+                    '  WHERE seen.source = versions.source'
+                    '  AND seen.id = versions.id)',
+                    (run, source),
+                )
+        return run
+
+    def _record_row(self, run, source, row):
+        id = row[JOB_ID]
+        if not self.con.execute(
+            'INSERT OR IGNORE INTO seen VALUES (?, ?)',
+            (source, id),
+        ).rowcount:
+            # The same posting twice in one export: the first one counts.
+            return
+        record = json.dumps(row)
+        fingerprint = hashlib.sha1(record.encode()).hexdigest()
+        current = self.con.execute(
+            'SELECT rowid, fingerprint FROM versions'
+            ' WHERE source = ? AND id = ? AND valid_to IS NULL',
+            (source, id),
+        ).fetchone()
+        if current is not None:
+            if current[1] == fingerprint:
+                return
+            self.con.execute(
+                'UPDATE versions SET valid_to = ? WHERE rowid = ?',
+                (run, current[0]),
+            )
+        self.con.execute(
+            'INSERT INTO versions VALUES (?, ?, ?, NULL, ?, ?)',
+            (source, id, run, fingerprint, record),
+        )
+
+    def runs(self):
+        # (run, taken, exports, postings) of every run, oldest first.
+        return [
+            (run, taken, json.loads(exports), postings)
+            for run, taken, exports, postings in self.con.execute(
+                'SELECT run, taken, exports, ('
+                '  SELECT count(*) FROM versions'
+                '  WHERE valid_from <= run'
+                '  AND (valid_to IS NULL OR valid_to > run))'
+                ' FROM runs ORDER BY run'
+            )
+        ]
+
+    def latest(self, n=2):
+        return [
+            run for (run,) in self.con.execute(
+                'SELECT run FROM runs ORDER BY run DESC LIMIT ?',
+                (n,),
+            )
+        ][::-1]
+
+    def _version(self, source, id, run):
+        row = self.con.execute(
+            'SELECT fingerprint, record FROM versions'
+            ' WHERE source = ? AND id = ? AND valid_from <= ?'
+            ' AND (valid_to IS NULL OR valid_to > ?)',
+            (source, id, run, run),
+        ).fetchone()
+        return (None, None) if row is None else (row[0], json.loads(row[1]))
+
+    def diff(self, old, new):
+        # (change, source, id, old record, new record) for every posting
+        # that was added, removed or changed between runs old and new.
+        keys = self.con.execute(
+            'SELECT source, id FROM versions'
+            ' WHERE valid_from > ? AND valid_from <= ?'
+            ' UNION SELECT source, id FROM versions'
+            ' WHERE valid_to > ? AND valid_to <= ?'
+            ' ORDER BY source, id',
+            (old, new, old, new),
+        ).fetchall()
+        for source, id in keys:
+            old_fp, before = self._version(source, id, old)
+            new_fp, after = self._version(source, id, new)
+            if old_fp == new_fp:
+                continue
+            if before is None:
+                change = 'added'
+            elif after is None:
+                change = 'removed'
+            else:
+                change = 'changed'
+            yield change, source, id, before, after
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def describe_changes(before, after):
+    # 'column: old -> new' for each column that differs.
+    return '; '.join(
+        f'{column}: {before.get(column, "")} -> {value}'
+        for column, value in after.items()
+        if before.get(column, '') != value
+    )
+
+
+def write_diff(changes, fh):
+    header = None
+    writer = csv.writer(fh, lineterminator=os.linesep)
+    for change, source, id, before, after in changes:
+        record = after if after is not None else before
+        if header is None:
+            header = DIFF_COLUMNS + list(record)
+            writer.writerow(header)
+        described = ''
+        if change == 'changed':
+            described = describe_changes(before, after)
+        writer.writerow(
+            [change, source, id, described]
+            + [record.get(column, '') for column in header[len(DIFF_COLUMNS):]]
+        )
+    if header is None:
+        writer.writerow(DIFF_COLUMNS)
+
+
+def add_snapshot_arguments(parser):
+    parser.add_argument(
+        '--snapshots',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'snapshots.sqlite',
+        help='where every run is recorded, for _clean/snapshots.py diff',
+    )
+    parser.add_argument(
+        '--no-snapshots',
+        action='store_true',
+        help='do not record this run',
+    )
+
+
+def snapshots_from_args(cfg):
+    if cfg.no_snapshots:
+        return None
+    return SnapshotStore(cfg.snapshots)
+
+
+if __name__ == '__main__':
+    add_snapshot_arguments(parser)
+    cfg = parser.parse_args()
+    with SnapshotStore(cfg.snapshots) as store:
+        if cfg.command == 'runs':
+            for run, taken, exports, postings in store.runs():
+                files = ', '.join(
+                    f'{source} {name}' for source, name in exports.items()
+                )
+                print(f'{run:4d}  {taken}  {postings:6d} postings  {files}')
+            sys.exit(0)
+        old, new = cfg.old, cfg.new
+        if old is None:
+            latest = store.latest(2)
+            if len(latest) < 2:
+                parser.error('there are fewer than two runs to compare')
+            old, new = latest
+        elif new is None:
+            new = store.latest(1)[0]
+        changes = store.diff(old, new)
+        if cfg.output is None:
+            write_diff(changes, sys.stdout)
+        else:
+            with open(cfg.output, 'w', newline='') as fh:
+                write_diff(changes, fh)
@@ -0,0 +1,300 @@
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import bisect
+import cProfile
+import functools
+import json
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# Upper bounds (ms) of the fetch latency histogram buckets.
+LATENCY_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Profilers that timed(), count() and record_fetch() report to.
+_active = []
+
+
+def no_stage(name):
+    return nullcontext()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+
+class StageTimer:
+    # Passed as stage= to the cleaners and the pipeline; each
+    # `with stage(name):` block adds its wall and CPU time to name and
+    # records the peak resident memory of the process when it ends. With
+    # trace_memory, it also records the most memory Python had allocated
+    # at any point during the stage (tracemalloc, which slows things down).
+
+    def __init__(self, trace_memory=False):
+        self.stages = {}
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def __call__(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            record = self.stages.setdefault(
+                name,
+                {'wall': 0.0, 'cpu': 0.0, 'peak_rss_mb': 0.0},
+            )
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['peak_rss_mb'] = peak_rss_mb()
+            if self.trace_memory:
+                record['peak_alloc_mb'] = max(
+                    record.get('peak_alloc_mb', 0.0),
+                    tracemalloc.get_traced_memory()[1] / 2**20,
+                )
+
+
+class _RawStats:
+    # Lets pstats.Stats load a stats dict that came from another process.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler(StageTimer):
+    # A StageTimer that, while active(), also collects the timed() calls,
+    # fetch latencies, bytes and counters, and with dump=True runs cProfile
+    # over every stage so the hottest one can be written out.
+
+    def __init__(self, dump=False):
+        super().__init__()
+        self.dump = dump
+        self.started = time.perf_counter()
+        self.calls = {}
+        self.counters = {}
+        self.fetch = {
+            'network': 0,
+            'from_cache': 0,
+            'bytes': 0,
+            'seconds': 0.0,
+            'histogram_ms': [0] * (len(LATENCY_BUCKETS) + 1),
+        }
+        self.pstats = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, name):
+        profile = None
+        if self.dump:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is already running.
+                profile = None
+        try:
+            with super().__call__(name):
+                yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.create_stats()
+                self._add_pstats(name, profile.stats)
+
+    def _add_pstats(self, name, stats):
+        if name in self.pstats:
+            merged = pstats.Stats(_RawStats(self.pstats[name]))
+            merged.add(_RawStats(stats))
+            stats = merged.stats
+        self.pstats[name] = stats
+
+    @contextmanager
+    def active(self):
+        _active.append(self)
+        try:
+            yield self
+        finally:
+            _active.remove(self)
+
+    def add_call(self, name, wall, cpu):
+        with self.lock:
+            record = self.calls.setdefault(
+                name,
+                {'calls': 0, 'wall': 0.0, 'cpu': 0.0},
+            )
+            record['calls'] += 1
+            record['wall'] += wall
+            record['cpu'] += cpu
+
+    def add_count(self, name, n):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_fetch(self, seconds, nbytes, from_cache):
+        with self.lock:
+            if from_cache:
+                self.fetch['from_cache'] += 1
+                return
+            self.fetch['network'] += 1
+            self.fetch['bytes'] += nbytes
+            self.fetch['seconds'] += seconds
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds * 1000)
+            self.fetch['histogram_ms'][bucket] += 1
+
+    def merge(self, report):
+        # Folds in the report of a profiler that ran in a worker process.
+        # The workers run side by side, so a stage's wall time is that of
+        # the slowest one; CPU time adds up.
+        for name, record in report['stages'].items():
+            mine = self.stages.setdefault(
+                name,
+                {'wall': 0.0, 'cpu': 0.0, 'peak_rss_mb': 0.0},
+            )
+            mine['wall'] = max(mine['wall'], record['wall'])
+            mine['cpu'] += record['cpu']
+            mine['peak_rss_mb'] = max(
+                mine['peak_rss_mb'],
+                record['peak_rss_mb'],
+            )
+        for name, record in report['calls'].items():
+            mine = self.calls.setdefault(
+                name,
+                {'calls': 0, 'wall': 0.0, 'cpu': 0.0},
+            )
+            for key in mine:
+                mine[key] += record[key]
+        for name, n in report['counters'].items():
+            self.add_count(name, n)
+        for key in ['network', 'from_cache', 'bytes', 'seconds']:
+            self.fetch[key] += report['fetch'][key]
+        self.fetch['histogram_ms'] = [
+            a + b for a, b in zip(
+                self.fetch['histogram_ms'],
+                report['fetch']['histogram_ms'],
+            )
+        ]
+        for name, stats in report.get('pstats', {}).items():
+            self._add_pstats(name, stats)
+
+    def hottest(self):
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda name: self.stages[name]['wall'])
+
+    def report(self, pstats=False):
+        report = {
+            'total': time.perf_counter() - self.started,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+            'calls': self.calls,
+            'counters': self.counters,
+            'fetch': self.fetch,
+            'latency_buckets_ms': LATENCY_BUCKETS,
+        }
+        if pstats:
+            report['pstats'] = self.pstats
+        return report
+
+    def write(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        hottest = self.hottest()
+        report['hottest_stage'] = hottest
+        if hottest in self.pstats:
+            dump = path.with_suffix(f'.{hottest}.prof')
+            pstats.Stats(_RawStats(self.pstats[hottest])).dump_stats(dump)
+            report['cprofile_dump'] = str(dump)
+        with open(path, 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+
+def timed(func):
+    # Records every call of func with the active profiler, if there is one.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            for profiler in _active:
+                profiler.add_call(
+                    func.__name__,
+                    time.perf_counter() - wall,
+                    time.thread_time() - cpu,
+                )
+    return wrapper
+
+
+def count(name, n=1):
+    for profiler in _active:
+        profiler.add_count(name, n)
+
+
+def record_fetch(seconds, nbytes, from_cache):
+    for profiler in _active:
+        profiler.add_fetch(seconds, nbytes, from_cache)
+
+
+# What --profile without a file writes, in the output directory.
+PROFILE_NAME = 'profile.json'
+OUTPUT_DIR = Path(__file__).parent / '..' / 'output'
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        '--profile',
+        type=lambda s: Path(s),
+        nargs='?',
+        const=True,
+        help='write wall/CPU time per stage and per predicate, fetch '
+        'latencies, retries and bytes downloaded to this JSON file '
+        '(default profile.json in the top-level output directory)',
+    )
+    parser.add_argument(
+        '--profile-dump',
+        action='store_true',
+        help='with --profile, also run cProfile and write the stats of the '
+        'slowest stage next to the report',
+    )
+
+
+@contextmanager
+def profiler_from_args(cfg, directory=OUTPUT_DIR):
+    # Yields the stage= to use: a Profiler that writes its report on exit
+    # when --profile was given, no_stage otherwise. A bare --profile writes
+    # into directory: the pipeline passes its --output, while a standalone
+    # cleaner, whose output is a per-source subdirectory next to the
+    # deliverable csv files, keeps the default.
+    if cfg.profile is None:
+        yield no_stage
+        return
+    profiler = Profiler(cfg.profile_dump)
+    with profiler.active():
+        yield profiler
+    profiler.write(profile_path(cfg, directory))
+
+
+def profile_path(cfg, directory=OUTPUT_DIR):
+    # cfg.profile is True for --profile without a file.
+    if cfg.profile is True:
+        return Path(directory) / PROFILE_NAME
+    return cfg.profile
@@ -0,0 +1,138 @@
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+LOOKUP_BATCH = 900
+
+
+def source_digest(*paths):
+    # A digest of the source files a derivation runs. Passed to fingerprints
+    # as a param, it makes values stored by other code be worked out again.
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def fingerprints(frame, columns, *params):
+    hashes = pd.util.hash_pandas_object(frame[columns], index=False)
+    # Anything the derivation depends on besides the row itself (season
+    # window, source_digest of its code, ...) is folded into every
+    # fingerprint.
+    salt = hashlib.sha1(repr(params).encode()).hexdigest()[:8]
+    return hashes.map(lambda h: f'{h:016x}{salt}')
+
+
+class StateStore:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path)
+        self.con.execute(
+            'CREATE TABLE IF NOT EXISTS derived ('
+            ' source TEXT, id TEXT, name TEXT, fingerprint TEXT, value TEXT,'
+            ' PRIMARY KEY (source, id, name))'
+        )
+
+    def lookup(self, source, name, ids, fps):
+        keys = ids.astype(str)
+        unique = list(keys.unique())
+        # Only the rows for ids are read, in batches below SQLite's limit on
+        # query parameters, so a chunk never loads the whole table.
+        stored = [
+            pd.read_sql_query(
+                'SELECT id, fingerprint, value FROM derived '
+                'WHERE source = ? AND name = ? AND id IN ({})'.format(
+                    ', '.join('?' * len(batch))
+                ),
+                self.con,
+                params=(source, name, *batch),
+            )
+            for batch in (
+                unique[i:i + LOOKUP_BATCH]
+                for i in range(0, len(unique), LOOKUP_BATCH)
+            )
+        ]
+        if not stored:
+            stored = [pd.DataFrame(columns=['id', 'fingerprint', 'value'])]
+        stored = pd.concat(stored).set_index('id')
+        found = stored.reindex(keys.to_numpy())
+        hit = found['fingerprint'].to_numpy() == fps.to_numpy()
+        values = pd.Series(
+            [
+                json.loads(v) if h else None
+                for v, h in zip(found['value'], hit)
+            ],
+            index=ids.index,
+            dtype=object,
+        )
+        return values, pd.Series(hit, index=ids.index)
+
+    def save(self, source, name, ids, fps, values):
+        self.con.executemany(
+            'INSERT OR REPLACE INTO derived VALUES (?, ?, ?, ?, ?)',
+            [
+                (source, str(i), name, fp, json.dumps(v))
+                for i, fp, v in zip(ids, fps, values)
+            ],
+        )
+        self.con.commit()
+
+    def derive(self, source, name, ids, fps, compute, keep=None):
+        # Values whose fingerprint matches the stored one are reused; only
+        # new or changed rows are handed to compute, which gets the boolean
+        # mask of those rows and returns their values in order.
+        values, hit = self.lookup(source, name, ids, fps)
+        todo = ~hit
+        if todo.any():
+            computed = list(compute(todo))
+            values[todo] = pd.Series(computed, index=values.index[todo])
+            kept = np.array(
+                [keep is None or keep(v) for v in computed],
+                dtype=bool,
+            )
+            self.save(
+                source,
+                name,
+                ids[todo][kept],
+                fps[todo][kept],
+                [v for v, k in zip(computed, kept) if k],
+            )
+        return values
+
+    def close(self):
+        self.con.close()
+
+
+def derive(store, source, name, ids, fps, compute, keep=None):
+    if store is not None:
+        return store.derive(source, name, ids, fps, compute, keep=keep)
+    values = pd.Series(None, index=ids.index, dtype=object)
+    if len(values):
+        values[:] = list(compute(pd.Series(True, index=ids.index)))
+    return values
+
+
+def add_state_arguments(parser):
+    parser.add_argument(
+        '--state',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'state.sqlite',
+        help='where derived columns of unchanged postings are kept',
+    )
+    parser.add_argument(
+        '--no-state',
+        action='store_true',
+        help='recompute every posting from scratch',
+    )
+
+
+def state_from_args(cfg):
+    if cfg.no_state:
+        return None
+    return StateStore(cfg.state)
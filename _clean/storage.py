@@ -0,0 +1,214 @@
+from datetime import date
+from pathlib import Path
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__file__)
+
+# Derived date columns hold 'YYYY-MM-DD' strings (9999-xx-xx when no date
+# was found), which parquet stores as date32.
+DATE_COLUMNS = ['EARLIEST DATE', 'Letter Submission Deadline Date']
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _nan_for_none(frame):
+    # pyarrow hands back missing strings as None where read_csv gives NaN.
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            frame[column] = frame[column].where(frame[column].notna(), np.nan)
+    return frame
+
+
+def _read_arrow(path, skiprows, text_columns):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    table = csv.read_csv(
+        path,
+        read_options=csv.ReadOptions(skip_rows=skiprows),
+        convert_options=csv.ConvertOptions(
+            column_types={c: pa.string() for c in text_columns},
+            strings_can_be_null=True,
+        ),
+    )
+    frame = table.to_pandas()
+    for field in table.schema:
+        # Keep the text of anything arrow took for a date, and give
+        # all-empty columns the float dtype read_csv would.
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            frame[field.name] = table[field.name].cast(pa.string()).to_pandas()
+        elif pa.types.is_null(field.type):
+            frame[field.name] = frame[field.name].astype(float)
+    return _nan_for_none(frame)
+
+
+def read_source_csv(
+    path,
+    engine='c',
+    cache_dir=None,
+    skiprows=0,
+    text_columns=(),
+    **kwargs,
+):
+    cached = None
+    if cache_dir is not None:
+        key = hashlib.sha256(
+            repr((file_digest(path), skiprows, sorted(kwargs.items())))
+            .encode()
+        ).hexdigest()[:16]
+        cached = Path(cache_dir) / f'{Path(path).stem}-{key}.parquet'
+        if cached.exists():
+            return _nan_for_none(pd.read_parquet(cached))
+    frame = None
+    if engine == 'pyarrow':
+        try:
+            frame = _read_arrow(path, skiprows, text_columns)
+        except Exception as e:
+            logger.warning(
+                f'Arrow reader failed on {path}, using the default one:\n{e}'
+            )
+    if frame is None:
+        frame = pd.read_csv(path, skiprows=skiprows, **kwargs)
+    if cached is not None:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        frame.to_parquet(cached, index=False)
+    return frame
+
+
+def categorize(frame, columns):
+    # Keeps text columns that repeat a handful of values (sections, types,
+    # countries) as categoricals: each value is stored once and the rows
+    # hold small integer codes. They read and write as the same text.
+    for column in columns:
+        if column in frame.columns:
+            frame[column] = frame[column].astype('category')
+    return frame
+
+
+def _common_dtype(dtypes):
+    dtypes = set(dtypes)
+    if len(dtypes) == 1:
+        return dtypes.pop()
+    if all(
+        pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d)
+        for d in dtypes
+    ):
+        return np.dtype(float)
+    return np.dtype(object)
+
+
+def iter_source_csv(path, chunksize, skiprows=0, **kwargs):
+    # read_csv infers dtypes chunk by chunk, so a first pass settles on the
+    # dtype read_csv would give each column for the whole file and the
+    # second pass yields chunks that all use it.
+    seen = {}
+    for chunk in pd.read_csv(
+        path,
+        skiprows=skiprows,
+        chunksize=chunksize,
+        **kwargs,
+    ):
+        for column, dtype in chunk.dtypes.items():
+            seen.setdefault(column, []).append(dtype)
+    dtypes = {column: _common_dtype(d) for column, d in seen.items()}
+    yield from pd.read_csv(
+        path,
+        skiprows=skiprows,
+        chunksize=chunksize,
+        dtype=dtypes,
+        **kwargs,
+    )
+
+
+def _parquet_frame(frame):
+    frame = frame.copy()
+    for column in DATE_COLUMNS:
+        if column in frame.columns:
+            frame[column] = frame[column].map(
+                lambda s: date.fromisoformat(s) if isinstance(s, str) else None
+            )
+    return frame
+
+
+def write_frame(frame, path, parquet=False, append=False):
+    # append adds the rows to an existing csv without repeating the header.
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if append and path.exists():
+        frame.to_csv(path, index=False, mode='a', header=False)
+        return
+    frame.to_csv(path, index=False)
+    if parquet:
+        write_parquet(frame, path.with_suffix('.parquet'))
+
+
+def write_parquet(frame, path):
+    _parquet_frame(frame).to_parquet(path, index=False)
+
+
+def person_path(path, person):
+    # Where one person's version of an output goes: in a directory of
+    # their own next to it.
+    path = Path(path)
+    return path.parent / person / path.name
+
+
+def write_people(people, paths, parquet=False, append=False):
+    # people maps each person to outputs by kind, written to their
+    # person_path of paths[kind].
+    for person, outputs in people.items():
+        for kind, frame in outputs.items():
+            write_frame(
+                frame,
+                person_path(paths[kind], person),
+                parquet=parquet,
+                append=append,
+            )
+
+
+def read_frame(path):
+    path = Path(path)
+    if path.suffix == '.parquet':
+        frame = pd.read_parquet(path)
+        for column in DATE_COLUMNS:
+            if column in frame.columns:
+                frame[column] = frame[column].map(
+                    lambda d: d.isoformat() if isinstance(d, date) else d
+                )
+        return frame
+    return pd.read_csv(path)
+
+
+def add_storage_arguments(parser):
+    parser.add_argument(
+        '--csv-engine',
+        choices=['c', 'pyarrow'],
+        default='c',
+        help='parser for the raw exports (pyarrow needs pyarrow installed)',
+    )
+    parser.add_argument(
+        '--parquet',
+        action='store_true',
+        help='cache parsed exports as parquet and write every output as '
+        'parquet next to its csv (needs pyarrow)',
+    )
+    parser.add_argument(
+        '--input-cache',
+        type=lambda s: Path(s),
+        default=Path(__file__).parent / '..' / '.cache' / 'inputs',
+        help='where --parquet keeps the parsed exports',
+    )
+
+
+def input_cache_from_args(cfg):
+    return cfg.input_cache if cfg.parquet else None
@@ -0,0 +1,146 @@
+from pathlib import Path
+import csv
+import heapq
+import itertools
+import os
+import tempfile
+
+# Sorted runs merged at once; more runs are merged in several passes.
+MAX_FAN_IN = 64
+
+
+def _open_rows(path):
+    fh = open(path, newline='')
+    rows = csv.reader(fh)
+    return fh, next(rows), rows
+
+
+def _writer(fh):
+    # The dialect DataFrame.to_csv writes, so a row read back from one of
+    # its files is written out byte for byte as it was.
+    return csv.writer(fh, lineterminator=os.linesep)
+
+
+def _sort_key(header, keys, numeric):
+    # Same order as DataFrame.sort_values: missing values (empty fields)
+    # last, numeric columns compared as numbers.
+    positions = [(header.index(key), key in numeric) for key in keys]
+
+    def key(row):
+        values = []
+        for i, is_numeric in positions:
+            value = row[i]
+            if value == '':
+                values.append((1, 0))
+            else:
+                values.append((0, float(value) if is_numeric else value))
+        return values
+
+    return key
+
+
+def concat_csv(sources, path, transform=None):
+    # Appends csv files with the same header into path. transform, if
+    # given, is called with the position of the source and each row, and
+    # returns the row to write or None to leave it out.
+    header = None
+    with open(path, 'w', newline='') as out:
+        writer = _writer(out)
+        for i, source in enumerate(sources):
+            fh, source_header, rows = _open_rows(source)
+            with fh:
+                if header is None:
+                    header = source_header
+                    writer.writerow(header)
+                elif source_header != header:
+                    raise ValueError(f'{source} has different columns')
+                if transform is not None:
+                    rows = (transform(i, row) for row in rows)
+                    rows = (row for row in rows if row is not None)
+                writer.writerows(rows)
+
+
+def sorted_groups(sources, keys, numeric=()):
+    # For csv files that are each sorted by keys, yields the header and the
+    # rows with equal keys, as one list per source, in key order.
+    files = [_open_rows(source) for source in sources]
+    try:
+        header = files[0][1]
+        for source, (_, source_header, _) in zip(sources, files):
+            if source_header != header:
+                raise ValueError(f'{source} has different columns')
+        key = _sort_key(header, keys, numeric)
+        tagged = heapq.merge(
+            *(
+                zip(itertools.repeat(i), rows)
+                for i, (_, _, rows) in enumerate(files)
+            ),
+            key=lambda item: key(item[1]),
+        )
+        for _, group in itertools.groupby(tagged, lambda i: key(i[1])):
+            rows = [[] for _ in sources]
+            for i, row in group:
+                rows[i].append(row)
+            yield header, rows
+    finally:
+        for fh, _, _ in files:
+            fh.close()
+
+
+def _merge(runs, path, header, key):
+    files = [_open_rows(run) for run in runs]
+    try:
+        with open(path, 'w', newline='') as out:
+            writer = _writer(out)
+            writer.writerow(header)
+            # heapq.merge takes equal rows from earlier runs first, which
+            # keeps the sort stable.
+            writer.writerows(
+                heapq.merge(*(rows for _, _, rows in files), key=key)
+            )
+    finally:
+        for fh, _, _ in files:
+            fh.close()
+
+
+def sort_csv(sources, path, keys, numeric=(), chunksize=100000, tmpdir=None):
+    # External merge sort of the rows of the csv files in sources (which
+    # share a header) by keys into path: sorted runs of chunksize rows are
+    # written to tmpdir and then merged, so at most chunksize rows are in
+    # memory.
+    with tempfile.TemporaryDirectory(dir=tmpdir) as tmp:
+        tmp = Path(tmp)
+        header = None
+        runs = []
+        for source in sources:
+            fh, source_header, rows = _open_rows(source)
+            with fh:
+                if header is None:
+                    header = source_header
+                    key = _sort_key(header, keys, numeric)
+                elif source_header != header:
+                    raise ValueError(f'{source} has different columns')
+                while True:
+                    block = list(itertools.islice(rows, chunksize))
+                    if not block:
+                        break
+                    block.sort(key=key)
+                    run = tmp / f'run-{len(runs)}.csv'
+                    with open(run, 'w', newline='') as out:
+                        writer = _writer(out)
+                        writer.writerow(header)
+                        writer.writerows(block)
+                    runs.append(run)
+        if header is None:
+            raise ValueError('nothing to sort')
+        passes = 0
+        while len(runs) > MAX_FAN_IN:
+            merged = []
+            for i in range(0, len(runs), MAX_FAN_IN):
+                run = tmp / f'pass-{passes}-{len(merged)}.csv'
+                _merge(runs[i:i + MAX_FAN_IN], run, header, key)
+                merged.append(run)
+            runs = merged
+            passes += 1
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        _merge(runs, path, header, key)
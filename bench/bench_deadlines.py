@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Compares the single-pass deadline extractor against the datefinder scan it
+# replaced, on the bundled exports, and reports speed and disagreements.
+from pathlib import Path
+from datetime import datetime
+import argparse
+import sys
+import time
+
+import dateparser
+import pandas as pd
+from datefinder import find_dates
+
+root = Path(__file__).parent / '..'
+sys.path.insert(0, str(root / '_clean'))
+
+from deadlines import (  # noqa: E402
+    NO_DATE,
+    NO_TEXT,
+    DeadlineExtractor,
+    parse_date,
+    parse_dates,
+)
+
+parser = argparse.ArgumentParser(description='Benchmark deadline extraction')
+parser.add_argument(
+    '--aea',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'aea.csv',
+)
+parser.add_argument(
+    '--ejm',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'ejm.csv',
+)
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--show', action='store_true')
+
+
+def legacy_find_best(s, lowerbound, upperbound):
+    if pd.isna(s):
+        return NO_TEXT
+    clean_matches = []
+    result = list(find_dates(s, source=True))
+    sources = [r[1] for r in result]
+    for source in sources:
+        check = list(find_dates(source, strict=True))
+        if check:
+            clean_matches.extend(check)
+        else:
+            check2 = list(
+                find_dates(source + ' 2024', strict=True, source=True)
+            )
+            clean_matches.extend(c[0] for c in check2)
+    clean_matches = [c.replace(tzinfo=None) for c in clean_matches]
+    for c in sorted(clean_matches):
+        if c > lowerbound and c < upperbound:
+            return c
+    if clean_matches:
+        return min(clean_matches)
+    return NO_DATE
+
+
+def legacy_parse(s):
+    # The old code kept dateparser's None for text without a date, and then
+    # failed to compare it; parse_dates gives NO_DATE for it.
+    try:
+        return dateparser.parse(s) or NO_DATE
+    except TypeError:
+        return dateparser.parse('9999-02-02')
+
+
+def timed(func, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = [func(s) for s in texts]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+if __name__ == '__main__':
+    cfg = parser.parse_args()
+    lowerbound = datetime(2024, 10, 1)
+    upperbound = datetime(2024, 12, 1)
+    extractor = DeadlineExtractor(lowerbound, upperbound)
+    aea = pd.read_csv(cfg.aea, encoding_errors='replace')
+    ejm = pd.read_csv(cfg.ejm, skiprows=1)
+    sources = {
+        'aea': aea['jp_full_text'],
+        'ejm': ejm['Ad text (in markdown format)'],
+    }
+    for name, texts in sources.items():
+        old, old_t = timed(
+            lambda s: legacy_find_best(s, lowerbound, upperbound),
+            texts,
+            cfg.repeat,
+        )
+        new, new_t = timed(extractor.earliest, texts, cfg.repeat)
+        mismatches = [
+            (i, o, n) for i, (o, n) in enumerate(zip(old, new)) if o != n
+        ]
+        print(
+            f'{name}: {len(texts)} ads, datefinder {old_t:.3f}s, '
+            f'extractor {new_t:.3f}s ({old_t / new_t:.1f}x), '
+            f'{len(mismatches)} mismatches'
+        )
+        if cfg.show:
+            for i, o, n in mismatches:
+                print(f'  row {i}: datefinder {o:%Y-%m-%d}, '
+                      f'extractor {n:%Y-%m-%d}')
+    # The deadline columns, read per row by dateparser as they used to be
+    # and by parse_dates. Its memo is emptied between repeats.
+    columns = {
+        'aea': [aea['Application_deadline']],
+        'ejm': [ejm['Date closes'], ejm['Target date'], ejm['Deadline']],
+    }
+    for name, values in columns.items():
+        values = pd.concat(values, ignore_index=True)
+        old, old_t = timed(legacy_parse, values, cfg.repeat)
+
+        def fresh_parse_dates(_):
+            parse_date.cache_clear()
+            return parse_dates(values)
+
+        new, new_t = timed(fresh_parse_dates, [None], cfg.repeat)
+        mismatches = [
+            (v, o, n) for v, o, n in zip(values, old, new[0]) if o != n
+        ]
+        print(
+            f'{name} deadline columns: {len(values)} values, dateparser '
+            f'{old_t:.3f}s, parse_dates {new_t:.3f}s '
+            f'({old_t / new_t:.1f}x), {len(mismatches)} mismatches'
+        )
+        if cfg.show:
+            for v, o, n in mismatches:
+                print(f'  {v!r}: dateparser {o}, parse_dates {n}')
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# Checks the ad page extractors against the full-tree html.parser code they
+# replaced on the saved pages in bench/fixtures, and times both, alone and
+# interleaved with (simulated) fetching on a thread pool.
+from pathlib import Path
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+root = Path(__file__).parent / '..'
+sys.path.insert(0, str(root / '_clean'))
+
+from extract import (  # noqa: E402
+    PARSER,
+    PageParser,
+    aea_apply_link,
+    ejm_application_procedure,
+)
+from fetcher import fetch_all  # noqa: E402
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+parser = argparse.ArgumentParser(description='Benchmark ad page parsing')
+parser.add_argument('--repeat', type=int, default=20)
+parser.add_argument(
+    '--pages',
+    type=int,
+    default=400,
+    help='pages in the simulated fetch run',
+)
+parser.add_argument('--concurrency', type=int, default=16)
+parser.add_argument(
+    '--latency',
+    type=float,
+    default=0.05,
+    help='seconds each simulated fetch waits',
+)
+parser.add_argument('--parse-workers', type=int, default=2)
+
+
+def legacy_aea(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    links = soup.find_all(
+        'a',
+        class_='button',
+        string=lambda text: text and 'Apply for This Job' in text,
+    )
+    typ = None
+    for link in links:
+        if link.get_text() == 'Apply for This Job (link)':
+            typ = 'link'
+            continue
+        if link.get_text() == 'Apply for This Job':
+            typ = 'javascript'
+            continue
+        raise ValueError('No application link found.')
+    if typ == 'link':
+        return 'ok', None, link['href']
+    if typ == 'javascript':
+        return 'ok', None, 'JOEWEBAPPLY'
+    return 'no-link', None, None
+
+
+def legacy_ejm(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    div = soup.find(
+        'div',
+        class_='panel-heading',
+        string='Application procedure',
+    )
+    p = div.parent.find('div', class_='panel-body')
+    text = p.get_text(strip=True)
+    link = p.find('a')
+    return 'ok', text, link['href'] if link else None
+
+
+def outcome(func, content):
+    # What an extractor gives for a page, comparable across the old and
+    # new code: (status, text, link), or the type of error it raised.
+    try:
+        result = func(content)
+    except Exception as e:
+        return type(e).__name__
+    if isinstance(result, dict):
+        return result['status'], result['text'], result['link']
+    return result
+
+
+def best_time(func, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in pages:
+            outcome(func, content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def simulated_fetch(pages, extractor, parse, cfg):
+    def fetch_and_parse(content):
+        time.sleep(cfg.latency)
+        try:
+            return parse(extractor, content)
+        except Exception as e:
+            return type(e).__name__
+
+    start = time.perf_counter()
+    fetch_all(pages, fetch_and_parse, concurrency=cfg.concurrency)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    cfg = parser.parse_args()
+    sources = {
+        'aea': (legacy_aea, aea_apply_link),
+        'ejm': (legacy_ejm, ejm_application_procedure),
+    }
+    ok = True
+    for name, (legacy, extractor) in sources.items():
+        paths = sorted(FIXTURES.glob(f'{name}_*.html'))
+        pages = [path.read_bytes() for path in paths]
+        variants = {
+            PARSER: extractor,
+            'html.parser': (
+                lambda c, e=extractor: e(c, parser='html.parser')
+            ),
+        }
+        for path, content in zip(paths, pages):
+            expected = outcome(legacy, content)
+            for variant, func in variants.items():
+                got = outcome(func, content)
+                if got != expected:
+                    ok = False
+                    print(f'MISMATCH {path.name} ({variant}): '
+                          f'{got!r} != {expected!r}')
+        old_t = best_time(legacy, pages, cfg.repeat)
+        timings = ', '.join(
+            f'{variant} {t * 1000 / len(pages):.2f}ms '
+            f'({old_t / t:.1f}x)'
+            for variant, t in (
+                (v, best_time(f, pages, cfg.repeat))
+                for v, f in variants.items()
+            )
+        )
+        print(
+            f'{name}: {len(pages)} pages, full html.parser tree '
+            f'{old_t * 1000 / len(pages):.2f}ms/page, {timings}'
+        )
+        many = [pages[i % len(pages)] for i in range(cfg.pages)]
+        with PageParser(0) as inline, \
+                PageParser(cfg.parse_workers) as workers:
+            inline_t = simulated_fetch(many, extractor, inline, cfg)
+            workers_t = simulated_fetch(many, extractor, workers, cfg)
+            where = (
+                'on the fetching threads' if workers.pool is None
+                else f'in {cfg.parse_workers} worker processes'
+            )
+        print(
+            f'  {cfg.pages} fetches at concurrency {cfg.concurrency}: '
+            f'parsed on the fetching threads {inline_t:.2f}s, with '
+            f'--parse-workers {cfg.parse_workers} ({where}) {workers_t:.2f}s'
+        )
+    print(f'extraction check {"passed" if ok else "FAILED"}')
+    sys.exit(0 if ok else 1)
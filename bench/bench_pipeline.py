@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Times every stage of the cleaning pipeline on synthetic exports at several
+# multiples of the bundled data, and checks that the bundled data still
+# cleans to the recorded golden outputs.
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = Path(__file__).parent / '..'
+sys.path.insert(0, str(root / '_clean'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+GOLDEN = Path(__file__).parent / 'golden.json'
+STAGES = ['load', 'classify', 'dates', 'links', 'format', 'write', 'snapshot',
+          'dedupe', 'join', 'sort']
+
+parser = argparse.ArgumentParser(description='Benchmark the pipeline')
+parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100])
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument(
+    '--data-dir',
+    type=lambda s: Path(s),
+    default=root / '.cache' / 'bench',
+    help='where the synthetic exports and their outputs are written',
+)
+parser.add_argument(
+    '--check',
+    action='store_true',
+    help='only compare the outputs for the bundled data with golden.json',
+)
+parser.add_argument(
+    '--update',
+    action='store_true',
+    help='record the current outputs for the bundled data as golden (the '
+    'commit that does so should say which rows changed and why)',
+)
+parser.add_argument(
+    '--json',
+    type=lambda s: Path(s),
+    help='also write the timings here',
+)
+parser.add_argument(
+    '--memory',
+    action='store_true',
+    help='also trace the memory Python allocates in each stage (slower)',
+)
+# Anything else is handed to _clean/pipeline.py (--workers, --csv-engine,
+# --parquet, ...).
+
+
+def pipeline_env():
+    # The outputs do not depend on the hash seed (COUNTRIES keep the order
+    # their locations are listed in); it is pinned so that the check stays
+    # reproducible should one come to.
+    return dict(os.environ, PYTHONHASHSEED='0')
+
+
+def run_pipeline(aea, ejm, output, extra):
+    command = [
+        sys.executable,
+        str(root / '_clean' / 'pipeline.py'),
+        '--aea', str(aea),
+        '--ejm', str(ejm),
+        '--output', str(output),
+        '--admin', str(output / 'to_admin.csv'),
+        '--no-state',
+        '--no-search-index',
+        '--no-snapshots',
+        *extra,
+    ]
+    subprocess.run(command, check=True, env=pipeline_env())
+
+
+def digests(output):
+    return {
+        str(path.relative_to(output)): hashlib.sha256(
+            path.read_bytes()
+        ).hexdigest()
+        for path in sorted(output.rglob('*.csv'))
+    }
+
+
+def golden(update, extra):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp)
+        run_pipeline(
+            root / 'data' / 'aea.csv',
+            root / 'data' / 'ejm.csv',
+            output,
+            extra,
+        )
+        current = digests(output)
+    if update:
+        GOLDEN.write_text(json.dumps(current, indent=2) + '\n')
+        print(f'recorded {len(current)} outputs in {GOLDEN}')
+        return True
+    expected = json.loads(GOLDEN.read_text())
+    ok = True
+    for name in sorted(set(expected) | set(current)):
+        if expected.get(name) != current.get(name):
+            print(f'DIFF {name}')
+            ok = False
+    print(f'golden check {"passed" if ok else "FAILED"}')
+    return ok
+
+
+def run_one(aea, ejm, output, extra, memory=False):
+    # Runs in its own process, so the peak memory belongs to one scale.
+    import pipeline
+    from stages import StageTimer, peak_rss_mb
+
+    cfg = pipeline.parser.parse_args([
+        '--aea', str(aea),
+        '--ejm', str(ejm),
+        '--output', str(output),
+        '--admin', str(output / 'to_admin.csv'),
+        '--no-state',
+        '--no-search-index',
+        '--no-snapshots',
+        '--serial',
+        *extra,
+    ])
+    timer = StageTimer(trace_memory=memory)
+    start = time.perf_counter()
+    pipeline.run(cfg, timer)
+    print(json.dumps({
+        'total': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timer.stages,
+    }))
+
+
+def bench_scale(scale, cfg, extra):
+    from synth import write_synthetic
+
+    directory = cfg.data_dir / f'x{scale:g}-seed{cfg.seed}'
+    aea, ejm = directory / 'aea.csv', directory / 'ejm.csv'
+    if not (aea.exists() and ejm.exists()):
+        write_synthetic(directory, scale, cfg.seed)
+    rows = sum(1 for _ in open(aea, encoding='utf-8-sig'))
+    result = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            '--run-one', str(aea), str(ejm), str(directory / 'output'),
+            *(['--memory'] if cfg.memory else []),
+            *extra,
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=pipeline_env(),
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['scale'] = scale
+    report['input_mb'] = (aea.stat().st_size + ejm.stat().st_size) / 2**20
+    report['aea_lines'] = rows
+    return report
+
+
+def print_report(report):
+    print(
+        f'x{report["scale"]:g}: {report["input_mb"]:.1f} MB input, '
+        f'{report["total"]:.2f}s, peak {report["peak_rss_mb"]:.0f} MB'
+    )
+    for name in STAGES:
+        stage = report['stages'].get(name)
+        if stage is None:
+            continue
+        alloc = stage.get('peak_alloc_mb')
+        print(
+            f'  {name:<9}{stage["wall"]:8.2f}s wall {stage["cpu"]:8.2f}s cpu'
+            f'  {stage["peak_rss_mb"]:6.0f} MB'
+            + (f'  {alloc:6.1f} MB allocated' if alloc is not None else '')
+        )
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run-one']:
+        aea, ejm, output = (Path(s) for s in sys.argv[2:5])
+        memory = sys.argv[5:6] == ['--memory']
+        run_one(aea, ejm, output, sys.argv[5 + memory:], memory)
+        sys.exit(0)
+    cfg, extra = parser.parse_known_args()
+    if cfg.check or cfg.update:
+        sys.exit(0 if golden(cfg.update, extra) else 1)
+    reports = []
+    for scale in cfg.scales:
+        reports.append(bench_scale(scale, cfg, extra))
+        print_report(reports[-1])
+    if cfg.json is not None:
+        cfg.json.write_text(json.dumps(reports, indent=2) + '\n')
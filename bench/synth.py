@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Writes synthetic AEA and EJM exports with the schemas of the bundled ones at
+# any multiple of their size. Rows are recombined from groups of related
+# columns (title, institution, ad text with its deadlines, ...) taken from
+# different real postings, so the cleaners see new combinations rather than
+# copies, and every posting gets a fresh ID.
+from pathlib import Path
+import argparse
+
+import numpy as np
+import pandas as pd
+
+root = Path(__file__).parent / '..'
+
+AEA_GROUPS = [
+    ['joe_issue_ID', 'jp_section', 'jp_title', 'jp_keywords'],
+    ['jp_institution', 'jp_division', 'jp_department', 'locations'],
+    ['jp_full_text', 'Application_deadline', 'Date_Active'],
+    ['jp_salary_range', 'jp_agency_insertion_num'],
+    ['JEL_Classifications'],
+]
+
+EJM_GROUPS = [
+    ['Ad title', 'Types'],
+    ['Categories'],
+    [
+        'Department',
+        'Department URL',
+        'Institution',
+        'Institution URL',
+        'Address line 1',
+        'Address line 2',
+        'City',
+        'State/province',
+        'Postal code',
+        'Country',
+        'Latitude',
+        'Longitude',
+    ],
+    [
+        'Ad text (in markdown format)',
+        'Date posted',
+        'Target date',
+        'Deadline',
+        'Date closes',
+    ],
+    [
+        'Your note',
+        'Application method',
+        'Application URL',
+        'Application email',
+        'Application mail address',
+    ],
+]
+
+parser = argparse.ArgumentParser(description='Write synthetic exports')
+parser.add_argument('output', type=lambda s: Path(s))
+parser.add_argument('--scale', type=float, default=1)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument(
+    '--aea',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'aea.csv',
+)
+parser.add_argument(
+    '--ejm',
+    type=lambda s: Path(s),
+    default=root / 'data' / 'ejm.csv',
+)
+
+
+def recombine(real, groups, n, rng):
+    parts = [
+        real[group].iloc[rng.integers(0, len(real), n)].reset_index(drop=True)
+        for group in groups
+    ]
+    return pd.concat(parts, axis=1)
+
+
+def synthesize_aea(real, n, rng):
+    fake = recombine(real, AEA_GROUPS, n, rng)
+    fake['jp_id'] = real['jp_id'].max() + 1 + np.arange(n)
+    return fake[real.columns]
+
+
+def synthesize_ejm(real, n, rng):
+    fake = recombine(real, EJM_GROUPS, n, rng)
+    fake['Id'] = real['Id'].max() + 1 + np.arange(n)
+    fake['URL'] = 'https://econjobmarket.org/positions/' + fake['Id'].astype(
+        str
+    )
+    return fake[real.columns]
+
+
+def write_synthetic(output, scale=1, seed=0, aea_csv=None, ejm_csv=None):
+    aea_csv = aea_csv or root / 'data' / 'aea.csv'
+    ejm_csv = ejm_csv or root / 'data' / 'ejm.csv'
+    rng = np.random.default_rng(seed)
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    aea = pd.read_csv(aea_csv, encoding_errors='replace')
+    fake = synthesize_aea(aea, max(1, round(len(aea) * scale)), rng)
+    fake.to_csv(output / 'aea.csv', index=False, encoding='utf-8-sig')
+    ejm = pd.read_csv(ejm_csv, skiprows=1)
+    fake = synthesize_ejm(ejm, max(1, round(len(ejm) * scale)), rng)
+    with open(ejm_csv) as fh:
+        banner = fh.readline()
+    with open(output / 'ejm.csv', 'w') as fh:
+        fh.write(banner)
+        fake.to_csv(fh, index=False)
+    return output / 'aea.csv', output / 'ejm.csv'
+
+
+if __name__ == '__main__':
+    cfg = parser.parse_args()
+    for path in write_synthetic(
+        cfg.output,
+        cfg.scale,
+        cfg.seed,
+        cfg.aea,
+        cfg.ejm,
+    ):
+        print(path)
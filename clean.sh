@@ -2,9 +2,10 @@
 
 usage() {
     cat <<EOF
-Usage: $(basename "$0") [--getlinks] [--tries N]
+Usage: $(basename "$0") [--no-intermediate] [--keep-duplicates] [--getlinks] [--tries N] [--cache-dir DIR] [--offline]
 
-Runs the full cleaning pipeline:
+Runs the full cleaning pipeline in one process, cleaning the AEA and EJM
+data in parallel and passing the results between steps in memory:
 
   1. Cleans EJM data:
        input:  data/ejm.csv
@@ -16,16 +17,67 @@ Runs the full cleaning pipeline:
        output: output/excel/aea, output/discarded/aea,
                output/academic/aea, output/verbose/aea
 
-  3. Joins cleaned academic data:
-       input:  output/academic/ejm/ejm.csv,
-               output/academic/aea/aea.csv
-       output: output/academic/all/all.csv
+  3. Merges jobs listed on both AEA and EJM and joins cleaned academic data:
+       output: output/academic/all/all.csv, output/excel/all/all.csv,
+               output/verbose/all/duplicates.csv
 
-  4. Sorts to_admin.csv for easier review
+  4. Writes to_admin.csv, sorted for easier review
 
 Options:
+  --no-intermediate only write verbose, discarded, academic/all and to_admin.csv
+  --serial          clean AEA and EJM one after the other
+  --keep-duplicates keep both postings of jobs listed on AEA and on EJM
   --getlinks        attempt to fetch external links during cleaning
-  --tries N         number of retries when fetching links
+  --tries N         number of times a link is fetched before giving up
+  --backoff S       seconds the first retry waits at most, doubling for each
+                    further retry (default 1)
+  --retry-budget N  retries allowed over the whole run (default 200)
+  --retry-time S    no retries after S seconds of fetching (default 1800)
+  --journal DIR     where fetch outcomes are journaled so an interrupted run
+                    resumes (default .cache/journal)
+  --no-journal      neither write nor resume from the journal
+  --concurrency N   number of ad pages fetched at the same time (default 8)
+  --rate R          requests per second allowed for each host (default 2)
+  --burst N         requests each host may receive back to back (default 2)
+  --parse-workers N processes that parse fetched ad pages (default 0: with
+                    fewer than 2, or on one CPU, they are parsed on the
+                    fetching threads)
+  --all-rows        also work out deadlines and links of discarded postings
+  --people [DIR]    also filter for every person with a <person>.toml in DIR
+                    (default config/people), into output/people/<person>
+  --season-start D  ad-text deadlines after D (YYYY-MM-DD) are preferred
+  --season-end D    ad-text deadlines before D (YYYY-MM-DD) are preferred
+  --csv-engine E    parser for the raw exports: c (default) or pyarrow
+  --parquet         cache parsed exports under .cache/inputs and also write
+                    every output as parquet next to its csv
+  --chunksize N     stream the exports N postings at a time, appending to the
+                    outputs and sorting them on disk, so memory stays flat
+                    (not with --parquet)
+  --state FILE      where derived columns of unchanged postings are kept
+                    (default .cache/state.sqlite)
+  --no-state        recompute every posting from scratch
+  --update-admin    update to_admin.csv in place, keeping what was typed into
+                    it, instead of writing a new one
+  --snapshots FILE  where every run is recorded for _clean/snapshots.py diff
+                    (default .cache/snapshots.sqlite)
+  --no-snapshots    do not record this run
+  --search-index FILE
+                    full-text index of the postings, searched with
+                    _clean/search.py (default .cache/search.sqlite)
+  --no-search-index do not keep the full-text index
+  --workers N       processes used for per-posting deadline extraction
+                    (default 1)
+  --profile [FILE]  write time per stage and per predicate, fetch latencies,
+                    retries and bytes downloaded to FILE (default
+                    output/profile.json)
+  --profile-dump    with --profile, also write cProfile stats of the slowest
+                    stage next to the report
+  --cache-dir DIR   where fetched ad pages are cached (default .cache/http)
+  --cache-ttl H     hours before a cached page is revalidated (default 168)
+  --cache-max-size M
+                    megabytes of compressed pages to keep (default 1024)
+  --no-cache        always fetch ad pages from the network
+  --offline         only use cached ad pages, never touch the network
   -h, --help        show this message
 EOF
 }
@@ -35,22 +87,4 @@ if [[ "$1" == "-h" || "$1" == "--help" ]]; then
     exit 0
 fi
 
-/usr/bin/env python3 _clean/clean_ejm.py data/ejm.csv \
-    output/excel/ejm output/discarded/ejm output/academic/ejm output/verbose/ejm "$@"
-
-/usr/bin/env python3 _clean/clean_aea.py data/aea.csv \
-    output/excel/aea output/discarded/aea output/academic/aea output/verbose/aea "$@"
-
-/usr/bin/env python3 _clean/join.py \
-    output/excel/all/all.csv \
-    output/excel/aea/aea.csv \
-    output/excel/ejm/ejm.csv
-
-/usr/bin/env python3 _clean/join.py \
-    output/academic/all/all.csv \
-    output/academic/aea/aea.csv \
-    output/academic/ejm/ejm.csv
-
-cp output/excel/all/all.csv to_admin.csv
-
-./.sort.sh
+exec /usr/bin/env python3 _clean/pipeline.py "$@"
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from deadlines import NO_DATE, earliest_dates, parse_dates
+
+
+def test_values_without_a_date_are_no_date():
+    values = pd.Series(['2025-11-15', 'Open until filled', np.nan])
+    dates = parse_dates(values)
+    assert list(dates) == [datetime(2025, 11, 15), NO_DATE, NO_DATE]
+
+
+def test_earliest_dates_of_values_without_a_date():
+    first = parse_dates(pd.Series(['Open until filled', 'Until filled']))
+    second = parse_dates(pd.Series(['15 November 2025', np.nan]))
+    assert list(earliest_dates(first, second)) == ['2025-11-15', '9999-02-02']
@@ -0,0 +1,22 @@
+import pytest
+
+from gazetteer import Gazetteer
+from rules import load_rules
+
+# Spellings exclude.toml listed before its countries were resolved through
+# the gazetteer, as the old rule took them from posting locations.
+OLD_VARIANTS = [
+    'AUSTRALIA NSW',
+    'BRAZIL RJ',
+    'CHINA FUJIAN',
+    'CHINA MACAU',
+    'KOR',
+    'TAIWAN TAIPEI',
+    'TAIWAN TAIWAN TAIPEI',
+]
+
+
+@pytest.mark.parametrize('variant', OLD_VARIANTS)
+def test_old_exclude_variants_are_still_excluded(variant):
+    country = Gazetteer(cache_path=None).country(variant)
+    assert country in load_rules().countries
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from join import find_duplicates, join
+
+
+def excel(title, department, id):
+    return pd.DataFrame({
+        'Submission Type': [None],
+        'Letter Submission Deadline Date': ['2024-11-15'],
+        'Application Status': [pd.NA],
+        'Institution or Organization Name': ['Bank of Finland'],
+        'Department Name': [department],
+        'Job ID #': [id],
+        'Job Title': [title],
+        'Additional Instructions': [pd.NA],
+        'Ad Webpage Link': [f'https://example.org/{id}'],
+    })
+
+
+def test_unrelated_postings_of_one_institution_and_deadline_stay_apart():
+    frames = [
+        excel(
+            'Visiting Scholars Programme',
+            'Monetary Policy and Research Department',
+            1,
+        ),
+        excel('Other nonacademic', None, 2),
+    ]
+    duplicates = find_duplicates(frames)
+    assert duplicates == []
+    assert len(join(frames, duplicates)) == 2
+
+
+def test_same_job_on_both_sources_is_merged():
+    frames = [
+        excel('Assistant Professor of Economics', 'Economics', 1),
+        excel('Assistant Professor', 'Economics', 2),
+    ]
+    duplicates = find_duplicates(frames)
+    assert [(d.first_id, d.second_id) for d in duplicates] == [('1', '2')]
+    assert len(join(frames, duplicates)) == 1
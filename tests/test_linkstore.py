@@ -0,0 +1,18 @@
+import warnings
+
+from linkstore import OK, SKIPPED, link_record, link_table, with_skipped
+
+
+def test_with_skipped_on_an_empty_table():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        table = with_skipped(link_table([], []), [4, 2])
+    assert list(table.index) == [4, 2]
+    assert list(table['status']) == [SKIPPED, SKIPPED]
+
+
+def test_with_skipped_keeps_stored_records():
+    stored = link_table([2], [link_record(OK, link='https://example.org')])
+    table = with_skipped(stored, [4, 2])
+    assert list(table['status']) == [SKIPPED, OK]
+    assert table.loc[2, 'link'] == 'https://example.org'
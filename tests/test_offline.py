@@ -0,0 +1,32 @@
+import pytest
+
+from clean_aea import aea_applyforthisjoblink
+from clean_ejm import ejm_application_instructions
+from extract import PageParser
+from fetcher import RetryBudget
+from httpcache import ResponseCache
+from linkstore import ERROR
+
+
+class NoRetries(RetryBudget):
+
+    def retry(self, attempt):
+        raise AssertionError('retried an offline cache miss')
+
+
+@pytest.mark.parametrize('source', ['aea', 'ejm'])
+def test_offline_cache_miss_is_not_retried(tmp_path, source):
+    cache = ResponseCache(tmp_path, offline=True)
+    retry = NoRetries(tries=3)
+    url = 'https://example.org/ad/1'
+    with PageParser() as parse:
+        if source == 'aea':
+            record = aea_applyforthisjoblink(
+                url, None, cache, None, parse, retry
+            )
+        else:
+            record = ejm_application_instructions(
+                url, None, cache, None, None, parse, retry
+            )
+    assert record['status'] == ERROR
+    assert record['error'].startswith('OfflineCacheMiss')
@@ -0,0 +1,15 @@
+import pandas as pd
+
+from rules import CodeSet, any_in, flag, pack_flags
+
+
+def test_pack_flags_aligns_on_the_index():
+    # As after surviving() or in a --chunksize batch: not sorted.
+    index = pd.Index([7, 3, 5])
+    countries = pd.Series([['CHINA'], ['FRANCE'], ['CHINA']], index=index)
+    bad = any_in(countries, CodeSet(['FRANCE']))
+    frame = pd.DataFrame(
+        {'FLAGS': pack_flags({'BAD COUNTRY': bad}, index)},
+        index=index,
+    )
+    assert list(flag(frame, 'BAD COUNTRY')) == [False, True, False]